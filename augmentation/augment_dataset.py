@@ -2,13 +2,128 @@ import cv2
 import albumentations as A
 from pathlib import Path
 import os
+import json
+import zlib
+import random
+import shutil
 import logging
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+DEFAULT_DATASET_ROOT = Path(__file__).resolve().parent.parent / "dataset"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_FLUSH_EVERY = 200  # как часто сохранять манифест во время обработки
+
+# Аугментатор процесса-обработчика, создается в _init_worker
+_worker_augmenter = None
+
+
+def _init_worker():
+    """Инициализация процесса пула: трансформации создаются один раз на процесс"""
+    global _worker_augmenter
+    cv2.setNumThreads(1)  # параллельность уже на уровне процессов
+    _worker_augmenter = MusicSymbolAugmenter()
+
+
+def image_seed(seed, relpath):
+    """
+    Зерно генератора для одного изображения
+
+    Зависит только от общего seed и относительного пути, поэтому результат
+    не меняется от числа процессов и порядка обработки.
+    """
+    return zlib.crc32(f"{seed}|{relpath}".encode('utf-8'))
+
+
+def _augment_image(task, augmenter=None):
+    """
+    Копирует оригинал и сохраняет аугментированные версии одного изображения
+
+    Аргументы:
+        task: (split, путь к изображению, выходная папка класса, относительный путь,
+               число аугментаций, зерно)
+        augmenter: MusicSymbolAugmenter (в процессах пула берется _worker_augmenter)
+
+    Возвращает:
+        (относительный путь, список созданных файлов относительно выходной папки
+         или None, если изображение не загрузилось)
+    """
+    split, img_path, output_class_dir, relpath, count, seed = task
+    augmenter = augmenter or _worker_augmenter
+    transform = augmenter.train_transform if split == 'train' else augmenter.val_transform
+
+    img = cv2.imread(img_path)
+    if img is None:
+        return relpath, None
+
+    random.seed(seed)
+    np.random.seed(seed)
+
+    img_file = os.path.basename(img_path)
+    class_dir = os.path.basename(output_class_dir)
+    # Оригинал копируется без перекодирования
+    shutil.copyfile(img_path, os.path.join(output_class_dir, img_file))
+    outputs = [f"{class_dir}/{img_file}"]
+
+    for i in range(count):
+        augmented = transform(image=img)["image"]
+        aug_file = f"{Path(img_file).stem}_aug{i}{Path(img_file).suffix}"
+        cv2.imwrite(os.path.join(output_class_dir, aug_file), augmented)
+        outputs.append(f"{class_dir}/{aug_file}")
+
+    return relpath, outputs
+
+
+def _remove_outputs(output_path, names):
+    for name in names:
+        out_file = os.path.join(output_path, name)
+        if os.path.exists(out_file):
+            os.remove(out_file)
+
+
+def _load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        logging.warning(f"Манифест {path} поврежден, часть будет обработана заново")
+        return {}
+
+
+def _save_manifest(path, manifest):
+    # Через временный файл, чтобы прерванная запись не испортила манифест
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
 
 class MusicSymbolAugmenter:
-    def __init__(self):
-        """Инициализация трансформаций"""
+    def __init__(self, input_root=None, output_root=None, train_augmentations=3,
+                 val_augmentations=1, workers=None, seed=0):
+        """
+        Инициализация трансформаций
+
+        Аргументы:
+            input_root: папка датасета с train/ и val/ (по умолчанию dataset/ в корне репозитория)
+            output_root: куда писать train_augmented/ и val_augmented/ (по умолчанию input_root)
+            train_augmentations: число аугментаций на изображение для train
+            val_augmentations: число аугментаций на изображение для val
+            workers: число процессов (None — по числу ядер, 1 — без пула)
+            seed: общее зерно; результат для каждого изображения детерминирован
+        """
+        self.input_root = str(input_root or DEFAULT_DATASET_ROOT)
+        self.output_root = str(output_root or self.input_root)
+        self.train_augmentations = train_augmentations
+        self.val_augmentations = val_augmentations
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+
         self.train_transform = A.Compose([
             A.Rotate(limit=15, border_mode=cv2.BORDER_REFLECT, p=0.7),
             A.ShiftScaleRotate(shift_limit=0.05, scale_limit=0.1, rotate_limit=0, p=0.5),
@@ -23,19 +138,21 @@ class MusicSymbolAugmenter:
             A.RandomBrightnessContrast(brightness_limit=0.1, contrast_limit=0.1, p=0.5),
         ])
 
-    def augment_dataset(self):
+    def augment_dataset(self, force=False):
         """
         Аугментирует данные и сохраняет в папки train_augmented и val_augmented
-        внутри основной папки dataset
+        внутри output_root
+
+        Изображения, для которых результат по манифесту актуален, пропускаются;
+        force=True обрабатывает все заново. Файлы, которых нет в новых записях
+        манифеста (удаленные исходники, лишние аугментации), удаляются.
         """
-        # Базовые пути
-        base_path = r"C:\Users\user\Documents\GitHub\music-symbols-detector\dataset"
-        train_path = os.path.join(base_path, "train")
-        val_path = os.path.join(base_path, "val")
+        train_path = os.path.join(self.input_root, "train")
+        val_path = os.path.join(self.input_root, "val")
 
-        # Выходные пути (внутри dataset)
-        train_output = os.path.join(base_path, "train_augmented")
-        val_output = os.path.join(base_path, "val_augmented")
+        # Выходные пути
+        train_output = os.path.join(self.output_root, "train_augmented")
+        val_output = os.path.join(self.output_root, "val_augmented")
 
         try:
             # Обработка тренировочных данных
@@ -43,8 +160,9 @@ class MusicSymbolAugmenter:
                 self._process_split(
                     input_path=train_path,
                     output_path=train_output,
-                    transform=self.train_transform,
-                    augmentations_per_image=3
+                    split='train',
+                    augmentations_per_image=self.train_augmentations,
+                    force=force
                 )
             else:
                 logging.error(f"Train directory not found: {train_path}")
@@ -54,8 +172,9 @@ class MusicSymbolAugmenter:
                 self._process_split(
                     input_path=val_path,
                     output_path=val_output,
-                    transform=self.val_transform,
-                    augmentations_per_image=1
+                    split='val',
+                    augmentations_per_image=self.val_augmentations,
+                    force=force
                 )
 
             logging.info("Аугментация завершена успешно!")
@@ -64,48 +183,102 @@ class MusicSymbolAugmenter:
             logging.error(f"Ошибка при аугментации: {str(e)}")
             raise
 
-    def _process_split(self, input_path: str, output_path: str,
-                       transform: A.Compose, augmentations_per_image: int):
-        """Обрабатывает одну часть датасета"""
+    def _is_up_to_date(self, record, stat, augmentations_per_image, output_path):
+        return (record is not None
+                and record['mtime_ns'] == stat.st_mtime_ns
+                and record['size'] == stat.st_size
+                and record['augmentations'] == augmentations_per_image
+                and record['seed'] == self.seed
+                and all(os.path.exists(os.path.join(output_path, name)) for name in record['outputs']))
+
+    def _process_split(self, input_path: str, output_path: str, split: str,
+                       augmentations_per_image: int, force: bool = False):
+        """Обрабатывает одну часть датасета, пропуская актуальные изображения"""
         logging.info(f"Обработка {input_path} -> {output_path}")
 
         # Создаем выходную директорию
         Path(output_path).mkdir(parents=True, exist_ok=True)
+        manifest_path = os.path.join(output_path, MANIFEST_NAME)
+        # Манифест загружается и при force: по нему удаляются устаревшие результаты
+        manifest = _load_manifest(manifest_path)
 
         # Получаем список классов
-        class_dirs = [d for d in os.listdir(input_path)
-                      if os.path.isdir(os.path.join(input_path, d))]
+        class_dirs = sorted(d for d in os.listdir(input_path)
+                            if os.path.isdir(os.path.join(input_path, d)))
 
-        for class_dir in tqdm(class_dirs, desc="Classes"):
+        tasks = []
+        stats = {}
+        for class_dir in class_dirs:
             # Создаем выходную поддиректорию для класса
             output_class_dir = os.path.join(output_path, class_dir)
             Path(output_class_dir).mkdir(parents=True, exist_ok=True)
 
-            # Обрабатываем изображения
             input_class_dir = os.path.join(input_path, class_dir)
-            for img_file in os.listdir(input_class_dir):
-                if img_file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    img_path = os.path.join(input_class_dir, img_file)
-                    img = cv2.imread(img_path)
-
-                    if img is not None:
-                        # Сохраняем оригинал
-                        orig_path = os.path.join(output_class_dir, img_file)
-                        cv2.imwrite(orig_path, img)
-
-                        # Генерируем аугментированные версии
-                        for i in range(augmentations_per_image):
-                            augmented = transform(image=img)["image"]
-                            aug_path = os.path.join(
-                                output_class_dir,
-                                f"{Path(img_file).stem}_aug{i}{Path(img_file).suffix}"
-                            )
-                            cv2.imwrite(aug_path, augmented)
-                    else:
-                        logging.warning(f"Не удалось загрузить {img_path}")
+            for img_file in sorted(os.listdir(input_class_dir)):
+                if not img_file.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                img_path = os.path.join(input_class_dir, img_file)
+                relpath = f"{class_dir}/{img_file}"
+                stats[relpath] = os.stat(img_path)
+                if not force and self._is_up_to_date(manifest.get(relpath), stats[relpath],
+                                                     augmentations_per_image, output_path):
+                    continue
+                tasks.append((split, img_path, output_class_dir, relpath,
+                              augmentations_per_image, image_seed(self.seed, relpath)))
+
+        # Результаты для удаленных из датасета изображений больше не нужны
+        removed = [relpath for relpath in manifest if relpath not in stats]
+        for relpath in removed:
+            _remove_outputs(output_path, manifest.pop(relpath)['outputs'])
+
+        logging.info(f"{split}: к обработке {len(tasks)}, актуальных {len(stats) - len(tasks)}, "
+                     f"удалено {len(removed)}")
+
+        if self.workers > 1 and len(tasks) > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+            chunksize = max(1, len(tasks) // (self.workers * 8))
+            results = executor.map(_augment_image, tasks, chunksize=chunksize)
+        else:
+            executor = None
+            results = (_augment_image(task, self) for task in tasks)
+
+        try:
+            for done, (relpath, outputs) in enumerate(tqdm(results, total=len(tasks), desc=split), 1):
+                # Файлы прежней записи, которых нет в новой (например, при меньшем числе аугментаций)
+                old_record = manifest.pop(relpath, None)
+                if old_record is not None:
+                    _remove_outputs(output_path, set(old_record['outputs']) - set(outputs or ()))
+                if outputs is None:
+                    logging.warning(f"Не удалось загрузить {os.path.join(input_path, relpath)}")
+                else:
+                    stat = stats[relpath]
+                    manifest[relpath] = {
+                        'mtime_ns': stat.st_mtime_ns,
+                        'size': stat.st_size,
+                        'augmentations': augmentations_per_image,
+                        'seed': self.seed,
+                        'outputs': outputs
+                    }
+                if done % MANIFEST_FLUSH_EVERY == 0:
+                    _save_manifest(manifest_path, manifest)
+        finally:
+            # Сохраняем и при прерывании — следующий запуск продолжит с этого места
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            _save_manifest(manifest_path, manifest)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Аугментация датасета музыкальных символов")
+    parser.add_argument("--input", default=str(DEFAULT_DATASET_ROOT), help="папка с train/ и val/")
+    parser.add_argument("--output", default=None, help="папка для *_augmented (по умолчанию --input)")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (1 — без пула)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--train-augmentations", type=int, default=3)
+    parser.add_argument("--val-augmentations", type=int, default=1)
+    parser.add_argument("--force", action="store_true", help="игнорировать манифест и обработать все")
+    args = parser.parse_args()
+
     # Настройка логирования
     logging.basicConfig(
         level=logging.INFO,
@@ -113,5 +286,12 @@ if __name__ == "__main__":
     )
 
     # Инициализация и запуск
-    augmenter = MusicSymbolAugmenter()
-    augmenter.augment_dataset()
\ No newline at end of file
+    augmenter = MusicSymbolAugmenter(
+        input_root=args.input,
+        output_root=args.output,
+        train_augmentations=args.train_augmentations,
+        val_augmentations=args.val_augmentations,
+        workers=args.workers,
+        seed=args.seed
+    )
+    augmenter.augment_dataset(force=args.force)
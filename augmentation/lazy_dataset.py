@@ -0,0 +1,132 @@
+import os
+import zlib
+import random
+from contextlib import contextmanager
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def sample_seed(seed, epoch, idx):
+    """Зерно для одного обращения к датасету: зависит от seed, эпохи и индекса"""
+    return zlib.crc32(f"{seed}|{epoch}|{idx}".encode('utf-8'))
+
+
+@contextmanager
+def seeded_global_rng(seed):
+    """
+    Временно задает зерно глобальных генераторов random и numpy.random
+
+    Albumentations берет случайные параметры из глобальных генераторов, поэтому
+    зерно приходится задавать им; после выхода прежнее состояние восстанавливается,
+    чтобы не сбивать генераторы основного процесса (при num_workers=0 — состояние,
+    которое train.py сохраняет в чекпоинт).
+    """
+    python_state = random.getstate()
+    numpy_state = np.random.get_state()
+    random.seed(seed)
+    np.random.seed(seed)
+    try:
+        yield
+    finally:
+        random.setstate(python_state)
+        np.random.set_state(numpy_state)
+
+
+class AugmentedSymbolDataset(Dataset):
+    """
+    Аугментация на лету вместо записи train_augmented на диск
+
+    Датасет виртуально увеличен в expansion_factor раз: индекс idx соответствует
+    исходному изображению idx % N и варианту idx // N. Вариант 0 — оригинал
+    (как копия оригинала в train_augmented), остальные проходят через
+    Albumentations-трансформацию. Зерно зависит от (seed, эпоха, idx), поэтому
+    эпоха воспроизводима при любом числе процессов DataLoader, а разные эпохи
+    дают разные аугментации.
+
+    Возвращает тензор (1, H, W) в диапазоне [0, 1] (как после ToTensor),
+    к которому применяется tensor_transform, и метку.
+    """
+
+    def __init__(self, images, labels, transform, expansion_factor=4, seed=0,
+                 classes=None, tensor_transform=None, include_original=True):
+        """
+        Аргументы:
+            images: массив uint8 (N, H, W) в оттенках серого, например из кеша pack_dataset
+            labels: метки (N,)
+            transform: Albumentations-трансформация (например, MusicSymbolAugmenter().train_transform)
+            expansion_factor: во сколько раз увеличить датасет
+            seed: общее зерно
+            classes: имена классов (как у ImageFolder)
+            tensor_transform: преобразование тензора после аугментации (например, Normalize)
+            include_original: вариант 0 без аугментации
+        """
+        if expansion_factor < 1:
+            raise ValueError("expansion_factor должен быть не меньше 1")
+        self.images = images
+        self.labels = np.asarray(labels)
+        self.transform = transform
+        self.expansion_factor = expansion_factor
+        self.seed = seed
+        self.classes = classes
+        self.tensor_transform = tensor_transform
+        self.include_original = include_original
+        # Эпоха в общей памяти: процессы DataLoader (в том числе persistent_workers)
+        # видят значение, установленное в основном процессе
+        self._epoch = torch.zeros(1, dtype=torch.long).share_memory_()
+
+    @classmethod
+    def from_folder(cls, root, transform, image_size=64, **kwargs):
+        """
+        Загрузка папки в формате ImageFolder (root/<класс>/<изображение>) в память
+
+        Изображения декодируются один раз в оттенках серого и приводятся к image_size.
+        """
+        classes = sorted(d.name for d in os.scandir(root) if d.is_dir())
+        images = []
+        labels = []
+        for label, class_name in enumerate(classes):
+            class_dir = os.path.join(root, class_name)
+            for img_file in sorted(os.listdir(class_dir)):
+                if not img_file.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                img = cv2.imread(os.path.join(class_dir, img_file), cv2.IMREAD_GRAYSCALE)
+                if img is None:
+                    continue
+                if img.shape != (image_size, image_size):
+                    img = cv2.resize(img, (image_size, image_size), interpolation=cv2.INTER_AREA)
+                images.append(img)
+                labels.append(label)
+        images = np.stack(images) if images else np.empty((0, image_size, image_size), dtype=np.uint8)
+        return cls(images, np.array(labels, dtype=np.int64), transform, classes=classes, **kwargs)
+
+    @property
+    def epoch(self):
+        return int(self._epoch[0])
+
+    def set_epoch(self, epoch):
+        """Вызывается перед каждой эпохой, чтобы аугментации менялись от эпохи к эпохе"""
+        self._epoch[0] = epoch
+
+    def __len__(self):
+        return len(self.labels) * self.expansion_factor
+
+    def __getitem__(self, idx):
+        source = idx % len(self.labels)
+        image = np.asarray(self.images[source])
+
+        if idx >= len(self.labels) or not self.include_original:
+            with seeded_global_rng(sample_seed(self.seed, self.epoch, idx)):
+                image = self.transform(image=image)["image"]
+
+        tensor = torch.from_numpy(np.array(image, dtype=np.float32)).div_(255.0)
+        if tensor.dim() == 3:
+            # Трансформация вернула H x W x 1
+            tensor = tensor[..., 0]
+        tensor = tensor.unsqueeze(0)
+        if self.tensor_transform is not None:
+            tensor = self.tensor_transform(tensor)
+        return tensor, int(self.labels[source])
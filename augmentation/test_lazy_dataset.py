@@ -0,0 +1,31 @@
+import os
+import sys
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('torch')
+pytest.importorskip('cv2')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from augmentation.lazy_dataset import AugmentedSymbolDataset
+
+
+def _noise_transform(image):
+    # Как Albumentations: случайность берется из глобальных генераторов
+    return {'image': np.clip(image + np.random.randint(0, 50, image.shape) + random.randint(0, 5), 0, 255)}
+
+
+def test_getitem_keeps_global_rng_state():
+    dataset = AugmentedSymbolDataset(np.zeros((2, 8, 8), dtype=np.uint8), [0, 1], _noise_transform)
+    random.seed(1)
+    np.random.seed(1)
+    python_state, numpy_state = random.getstate(), np.random.get_state()
+
+    first = dataset[3][0]
+    assert random.getstate() == python_state
+    assert np.array_equal(np.random.get_state()[1], numpy_state[1])
+    # Аугментация по-прежнему определяется зерном образца
+    assert dataset[3][0].equal(first)
@@ -1,12 +1,16 @@
 import os
+import json
 import shutil
 import random
+import hashlib
+import argparse
 from pathlib import Path
 
 SOURCE_POS = Path("recognize_old/positive_images")
 SOURCE_NEG = Path("recognize_old/negative_images")
 DEST = Path("dataset")
 SPLIT_RATIO = 0.8  # 80% train, 20% val
+SPLIT_CACHE = DEST / ".split_cache.json"  # хеши исходников для инкрементальной сборки
 
 def prepare_dir(path):
     if path.exists():
@@ -24,28 +28,119 @@ def split_and_copy(src_paths, train_dir, val_dir):
     for f in val_files:
         shutil.copy(f, val_dir / f.name)
 
-def main():
-    random.seed(42)
+def content_split(path):
+    """train или val по хешу содержимого: разбиение не меняется между запусками"""
+    digest = hashlib.sha1(path.read_bytes()).digest()
+    return 'train' if int.from_bytes(digest[:8], 'big') / 2 ** 64 < SPLIT_RATIO else 'val'
 
 
-    print("\nПроверка классов в recognize_old/positive_images:")
-    pos_classes = [cls for cls in os.listdir(SOURCE_POS) if (SOURCE_POS / cls).is_dir()]
-    total_pos = 0
+def link_or_copy(src, dst):
+    """Жесткая ссылка вместо копии; копирование, если ссылка невозможна (другой диск, FAT)"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def is_current(src, dst):
+    """dst — ссылка на src или копия с тем же размером и временем изменения"""
+    try:
+        if os.path.samefile(src, dst):
+            return True
+        src_stat, dst_stat = src.stat(), dst.stat()
+    except FileNotFoundError:
+        return False
+    return src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+
+
+class SplitCache:
+    """Разбиение файлов по (размер, время изменения), чтобы не перечитывать неизменные исходники"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        self.used = {}
+
+    def split(self, src):
+        stat = src.stat()
+        key = str(src)
+        entry = self.entries.get(key)
+        if entry is None or entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+            entry = [stat.st_size, stat.st_mtime_ns, content_split(src)]
+        self.used[key] = entry
+        return entry[2]
+
+    def save(self):
+        # Сохраняются только файлы текущей сборки — удаленные исходники выпадают из кеша
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.used, f)
+
+
+def sync_class(src_paths, cls, cache):
+    """
+    Приводит DEST/train/cls и DEST/val/cls к нужному состоянию,
+    трогая только добавленные, измененные и удаленные файлы
+
+    Возвращает:
+        (добавлено, удалено)
+    """
+    wanted = {'train': {}, 'val': {}}
+    for f in src_paths:
+        wanted[cache.split(f)][f.name] = f
+
+    added = removed = 0
+    for split, files in wanted.items():
+        dest_dir = DEST / split / cls
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        for existing in dest_dir.iterdir():
+            src = files.get(existing.name)
+            if src is None or not is_current(src, existing):
+                existing.unlink()
+                removed += 1
+        for name, src in files.items():
+            dst = dest_dir / name
+            if not dst.exists():
+                link_or_copy(src, dst)
+                added += 1
+    return added, removed
+
+
+def build_incremental(pos_classes, neg_files):
+    cache = SplitCache(SPLIT_CACHE)
+    sources = {}
     for cls in pos_classes:
         files = []
         for ext in ("*.png", "*.jpg", "*.jpeg", "*.JPG", "*.JPEG"):
             files.extend((SOURCE_POS / cls).glob(ext))
-        print(f"  {cls}: {len(files)} файлов")
-        total_pos += len(files)
-    if total_pos == 0:
-        print("[!] Нет данных в recognize_old/positive_images. Проверьте структуру и наличие файлов.")
+        sources[cls] = files
+    sources['negative'] = neg_files
 
-    neg_files = []
-    for ext in ("*.png", "*.jpg", "*.jpeg", "*.JPG", "*.JPEG"):
-        neg_files.extend(SOURCE_NEG.rglob(ext))
-    print(f"\nНегативные примеры: {len(neg_files)} файлов в recognize_old/negative_images")
-    if len(neg_files) == 0:
-        print("[!] Нет данных в recognize_old/negative_images. Проверьте структуру и наличие файлов.")
+    # Классы, которых больше нет в исходниках
+    for split in ['train', 'val']:
+        split_dir = DEST / split
+        if split_dir.exists():
+            for class_dir in split_dir.iterdir():
+                if class_dir.is_dir() and class_dir.name not in sources:
+                    shutil.rmtree(class_dir)
+                    print(f"  удален класс {split}/{class_dir.name}")
+
+    total_added = total_removed = 0
+    for cls, files in sources.items():
+        added, removed = sync_class(files, cls, cache)
+        if added or removed:
+            print(f"  {cls}: +{added} -{removed}")
+        total_added += added
+        total_removed += removed
+    cache.save()
+    print(f"\nДобавлено файлов: {total_added}, удалено: {total_removed}")
+
+
+def build_full(pos_classes, neg_files):
+    random.seed(42)
 
     for split in ['train', 'val']:
         for cls in pos_classes:
@@ -61,6 +156,46 @@ def main():
         split_and_copy(files, DEST / 'train' / cls, DEST / 'val' / cls)
 
     split_and_copy(neg_files, DEST / 'train' / 'negative', DEST / 'val' / 'negative')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка датасета из recognize_old")
+    parser.add_argument("--mode", choices=["incremental", "full"], default="full",
+                        help="full — пересборка со случайным разбиением и копированием; incremental — "
+                             "разбиение по хешу содержимого, жесткие ссылки и только измененные файлы "
+                             "(первый запуск на собранном датасете меняет разбиение train/val)")
+    args = parser.parse_args()
+
+
+    print("\nПроверка классов в recognize_old/positive_images:")
+    pos_classes = [cls for cls in os.listdir(SOURCE_POS) if (SOURCE_POS / cls).is_dir()]
+    total_pos = 0
+    for cls in pos_classes:
+        files = []
+        for ext in ("*.png", "*.jpg", "*.jpeg", "*.JPG", "*.JPEG"):
+            files.extend((SOURCE_POS / cls).glob(ext))
+        print(f"  {cls}: {len(files)} файлов")
+        total_pos += len(files)
+    if total_pos == 0:
+        print("[!] Нет данных в recognize_old/positive_images. Проверьте структуру и наличие файлов.")
+
+    neg_files = []
+    for ext in ("*.png", "*.jpg", "*.jpeg", "*.JPG", "*.JPEG"):
+        neg_files.extend(SOURCE_NEG.rglob(ext))
+    print(f"\nНегативные примеры: {len(neg_files)} файлов в recognize_old/negative_images")
+    if len(neg_files) == 0:
+        print("[!] Нет данных в recognize_old/negative_images. Проверьте структуру и наличие файлов.")
+
+    if args.mode == "incremental":
+        if not SPLIT_CACHE.exists() and any((DEST / split).exists() for split in ('train', 'val')):
+            # Датасет собран в режиме full: разбиение по хешу не совпадает со случайным
+            print("\n[!] Разбиение train/val пересчитывается по хешу содержимого и отличается от текущего.\n"
+                  "    Устаревают чекпоинт обучения, кеш dataset_cache и манифесты аугментации.")
+        build_incremental(pos_classes, neg_files)
+    else:
+        if SPLIT_CACHE.exists():
+            SPLIT_CACHE.unlink()
+        build_full(pos_classes, neg_files)
     print("\n Датасет собран в папке /dataset")
 
 if __name__ == "__main__":
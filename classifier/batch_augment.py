@@ -0,0 +1,50 @@
+import math
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class BatchRandomAffine(nn.Module):
+    """
+    Случайный поворот и сдвиг сразу для всего батча (B, C, H, W)
+
+    Аналог RandomRotation(degrees) + RandomAffine(0, translate) из train.py,
+    но одна матрица преобразования на изображение и один вызов
+    affine_grid / grid_sample на батч вместо поэлементной работы с PIL.
+    """
+
+    def __init__(self, degrees=10.0, translate=(0.1, 0.1), fill=-1.0):
+        """
+        Аргументы:
+            degrees: максимальный угол поворота в градусах (±degrees)
+            translate: максимальный сдвиг по X и Y в долях ширины и высоты
+            fill: значение для пикселей за границей изображения; -1.0 — черный
+                после Normalize(0.5, 0.5), как fill=0 у torchvision до нормализации
+        """
+        super(BatchRandomAffine, self).__init__()
+        self.degrees = degrees
+        self.translate = translate
+        self.fill = fill
+
+    def forward(self, images):
+        if not self.training:
+            return images
+
+        batch_size = images.size(0)
+        device = images.device
+        angle = (torch.rand(batch_size, device=device) * 2 - 1) * math.radians(self.degrees)
+        # В координатах affine_grid ширина изображения равна 2
+        shift_x = (torch.rand(batch_size, device=device) * 2 - 1) * self.translate[0] * 2
+        shift_y = (torch.rand(batch_size, device=device) * 2 - 1) * self.translate[1] * 2
+
+        cos, sin = torch.cos(angle), torch.sin(angle)
+        theta = torch.stack([
+            torch.stack([cos, -sin, shift_x], dim=1),
+            torch.stack([sin, cos, shift_y], dim=1)
+        ], dim=1).to(images.dtype)
+
+        grid = F.affine_grid(theta, list(images.shape), align_corners=False)
+        # grid_sample заполняет нулями, поэтому сдвигаем значения так, чтобы ноль соответствовал fill
+        shifted = F.grid_sample(images - self.fill, grid, mode='bilinear',
+                                padding_mode='zeros', align_corners=False)
+        return shifted + self.fill
@@ -0,0 +1,77 @@
+"""
+Проверка совпадения и скорость способов исполнения классификатора.
+
+1. Совпадение логитов: экспортированные TorchScript и ONNX графы сравниваются
+   с eager-моделью на случайных входах; расхождение должно быть в пределах atol.
+2. Пропускная способность (символов/с) для каждого способа при разных размерах батча.
+
+Запуск:
+    cd classifier
+    python bench_backends.py [../models/classifier_cnn.pth]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import torch
+from predict import create_backend, onnxruntime
+from export_model import export_torchscript, export_onnx
+
+BATCH_SIZES = (1, 8, 32, 128)
+
+
+def check_parity(backends, atol=1e-4, samples=64):
+    """Сравнение логитов всех способов исполнения с eager; падает, если расхождение больше atol"""
+    torch.manual_seed(0)
+    inputs = torch.rand(samples, 1, 64, 64) * 2 - 1
+    with torch.no_grad():
+        reference = backends['eager'](inputs)
+        for name, backend in backends.items():
+            if name == 'eager':
+                continue
+            diff = (backend(inputs).float() - reference).abs().max().item()
+            status = "OK" if diff <= atol else "РАСХОЖДЕНИЕ"
+            print(f"  {name:<12} max|Δ| = {diff:.2e}  {status}")
+            assert diff <= atol, f"{name}: логиты расходятся с eager на {diff:.2e} (допуск {atol:.0e})"
+
+
+def throughput(backend, batch_size, min_time=1.0):
+    """Символов в секунду на случайных входах заданного размера батча"""
+    batch = torch.rand(batch_size, 1, 64, 64) * 2 - 1
+    with torch.no_grad():
+        for _ in range(3):
+            backend(batch)
+        processed = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_time:
+            backend(batch)
+            processed += batch_size
+    return processed / (time.perf_counter() - start)
+
+
+def main():
+    model_path = sys.argv[1] if len(sys.argv) > 1 else "../models/classifier_cnn.pth"
+
+    with tempfile.TemporaryDirectory() as export_dir:
+        backends = {'eager': create_backend(model_path, 'eager')}
+        backends['torchscript'] = create_backend(
+            export_torchscript(model_path, os.path.join(export_dir, 'model.pt')), 'torchscript')
+        if onnxruntime is not None:
+            backends['onnx'] = create_backend(
+                export_onnx(model_path, os.path.join(export_dir, 'model.onnx')), 'onnx')
+        else:
+            print("onnxruntime не установлен — ONNX пропущен")
+
+        print("Совпадение логитов с eager:")
+        check_parity(backends)
+
+        print(f"\nСимволов/с (torch threads: {torch.get_num_threads()}):")
+        print(f"{'батч':>6} " + " ".join(f"{name:>12}" for name in backends))
+        for batch_size in BATCH_SIZES:
+            row = [throughput(backend, batch_size) for backend in backends.values()]
+            print(f"{batch_size:>6} " + " ".join(f"{value:>12.0f}" for value in row))
+
+
+if __name__ == "__main__":
+    main()
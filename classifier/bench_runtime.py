@@ -0,0 +1,98 @@
+"""
+Матрица производительности инференса: потоки PyTorch × размер батча × число процессов.
+
+Каждый процесс создает свою копию классификатора с заданным числом потоков,
+процессы стартуют одновременно, суммарная пропускная способность (символов/с)
+показывает, какая комбинация лучше загружает узел. Для подбора
+INFERENCE_NUM_THREADS / INFERENCE_BATCH_SIZE в pipeline/config.py
+и PAGE_WORKERS при параллельной обработке страниц.
+
+Запуск:
+    cd classifier
+    python bench_runtime.py [--model ../models/classifier_cnn.pth] [--channels-last]
+"""
+
+import os
+import time
+import argparse
+import multiprocessing as mp
+import torch
+from model import initialize_model
+from predict import load_model, configure_runtime
+
+NUM_CLASSES = 31
+
+
+def _worker(model_path, threads, batch_size, channels_last, duration, barrier, results):
+    configure_runtime(num_threads=threads, interop_threads=1)
+    if model_path:
+        model, _ = load_model(model_path)
+    else:
+        # Для замера скорости веса не важны
+        model = initialize_model(NUM_CLASSES).eval()
+    batch = torch.rand(batch_size, 1, 64, 64) * 2 - 1
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+        batch = batch.contiguous(memory_format=torch.channels_last)
+
+    with torch.inference_mode():
+        for _ in range(3):
+            model(batch)
+        barrier.wait()
+        processed = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            model(batch)
+            processed += batch_size
+    results.put(processed / (time.perf_counter() - start))
+
+
+def measure(model_path, threads, batch_size, processes, channels_last, duration):
+    """Суммарная пропускная способность processes процессов (символов/с)"""
+    ctx = mp.get_context('spawn')
+    barrier = ctx.Barrier(processes)
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=_worker,
+                    args=(model_path, threads, batch_size, channels_last, duration, barrier, results))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    total = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    return total
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Матрица потоки × батч × процессы для инференса")
+    parser.add_argument("--model", default=None, help="чекпоинт .pth (по умолчанию случайные веса)")
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({1, 2, 4, cores}))
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--processes", type=int, nargs="+", default=sorted({1, 2, 4, cores}))
+    parser.add_argument("--channels-last", action="store_true")
+    parser.add_argument("--duration", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f"Ядер: {cores}, channels_last: {args.channels_last}")
+    print(f"{'потоки':>7} {'батч':>6} {'процессы':>9} {'символов/с':>12} {'потоков всего':>14}")
+    best = None
+    for processes in args.processes:
+        for threads in args.threads:
+            if threads * processes > cores * 2:
+                continue  # заведомая переподписка ядер
+            for batch_size in args.batch_sizes:
+                rate = measure(args.model, threads, batch_size, processes, args.channels_last, args.duration)
+                print(f"{threads:>7} {batch_size:>6} {processes:>9} {rate:>12.0f} {threads * processes:>14}")
+                if best is None or rate > best[0]:
+                    best = (rate, threads, batch_size, processes)
+
+    if best:
+        rate, threads, batch_size, processes = best
+        print(f"\nЛучшее: {rate:.0f} символов/с — потоки {threads}, батч {batch_size}, процессы {processes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import os
+import json
+import hashlib
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from PIL import Image
+
+IMAGE_SIZE = 64
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def _scan_image_folder(root):
+    """Классы и список (путь, метка) в том же порядке, что у datasets.ImageFolder"""
+    classes = sorted(d.name for d in os.scandir(root) if d.is_dir())
+    samples = []
+    for label, class_name in enumerate(classes):
+        class_dir = os.path.join(root, class_name)
+        for dirpath, _, filenames in sorted(os.walk(class_dir, followlinks=True)):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    samples.append((os.path.join(dirpath, filename), label))
+    return classes, samples
+
+
+def dataset_fingerprint(root):
+    """
+    Отпечаток папки с датасетом для инвалидации кеша
+
+    Учитываются время изменения папок (меняется при добавлении и удалении файлов)
+    и хеш списка файлов с их размерами и временем изменения (правка файла на месте).
+    """
+    digest = hashlib.sha1()
+    for dirpath, _, filenames in sorted(os.walk(root, followlinks=True)):
+        digest.update(f"{os.path.relpath(dirpath, root)}|{os.stat(dirpath).st_mtime_ns}\n".encode('utf-8'))
+        for filename in sorted(filenames):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                stat = os.stat(os.path.join(dirpath, filename))
+                digest.update(f"{filename}|{stat.st_size}|{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def pack_dataset(root, cache_dir, force=False):
+    """
+    Однократное декодирование датасета в memory-mapped массивы
+
+    В cache_dir записываются images.npy (uint8, N x 64 x 64), labels.npy и meta.json.
+    Если отпечаток папки не изменился, кеш используется повторно.
+
+    Аргументы:
+        root: папка в формате ImageFolder (например, ../dataset/train)
+        cache_dir: папка кеша
+        force: пересобрать кеш независимо от отпечатка
+
+    Возвращает:
+        Путь к папке кеша
+    """
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    fingerprint = dataset_fingerprint(root)
+
+    if not force and os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            if json.load(f).get('fingerprint') == fingerprint:
+                return cache_dir
+
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    classes, samples = _scan_image_folder(root)
+
+    images_tmp = os.path.join(cache_dir, 'images.tmp.npy')
+    images = np.lib.format.open_memmap(images_tmp, mode='w+', dtype=np.uint8,
+                                       shape=(len(samples), IMAGE_SIZE, IMAGE_SIZE))
+    labels = np.empty(len(samples), dtype=np.int64)
+    for i, (path, label) in enumerate(samples):
+        # Та же предобработка, что у ImageFolder + Grayscale + Resize в train.py
+        with Image.open(path) as image:
+            image = image.convert('RGB').convert('L').resize((IMAGE_SIZE, IMAGE_SIZE), Image.BILINEAR)
+            images[i] = np.asarray(image)
+        labels[i] = label
+    images.flush()
+    del images
+
+    # Сначала данные, затем meta.json — прерванная упаковка не выглядит актуальным кешем
+    os.replace(images_tmp, os.path.join(cache_dir, 'images.npy'))
+    np.save(os.path.join(cache_dir, 'labels.npy'), labels)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'fingerprint': fingerprint,
+            'classes': classes,
+            'count': len(samples),
+            'image_size': IMAGE_SIZE
+        }, f, ensure_ascii=False, indent=2)
+
+    print(f"Датасет {root} упакован в {cache_dir}: {len(samples)} изображений")
+    return cache_dir
+
+
+class MemmapImageDataset(Dataset):
+    """
+    Датасет из кеша pack_dataset: изображения читаются из memory-mapped массива
+    без обращения к файлам изображений.
+    Возвращает тензор (1, 64, 64) в диапазоне [0, 1] (как после ToTensor) и метку.
+    """
+
+    def __init__(self, cache_dir, transform=None):
+        with open(os.path.join(cache_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.cache_dir = cache_dir
+        self.classes = meta['classes']
+        self.labels = np.load(os.path.join(cache_dir, 'labels.npy'))
+        self.transform = transform
+        self._images = None
+
+    @property
+    def images(self):
+        # Отображение открывается лениво, чтобы каждый процесс DataLoader открыл файл сам
+        if self._images is None:
+            self._images = np.load(os.path.join(self.cache_dir, 'images.npy'), mmap_mode='r')
+        return self._images
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        image = torch.from_numpy(np.array(self.images[idx], dtype=np.float32)).div_(255.0).unsqueeze(0)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, int(self.labels[idx])
@@ -0,0 +1,64 @@
+import os
+import json
+import argparse
+import torch
+from predict import load_model
+
+
+def _save_metadata(output_path, class_names):
+    """Сохранение названий классов рядом с экспортированной моделью (<output_path>.json)"""
+    with open(output_path + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'class_names': list(class_names), 'num_classes': len(class_names)}, f,
+                  ensure_ascii=False, indent=2)
+
+
+def export_torchscript(model_path, output_path):
+    """
+    Экспорт обученной модели в TorchScript
+
+    Аргументы:
+        model_path: путь к чекпоинту .pth
+        output_path: путь для сохранения графа (.pt)
+    """
+    model, class_names = load_model(model_path, 'cpu')
+    example = torch.zeros(1, 1, 64, 64)
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(model, example))
+    scripted.save(output_path)
+    _save_metadata(output_path, class_names)
+    return output_path
+
+
+def export_onnx(model_path, output_path, opset_version=13):
+    """
+    Экспорт обученной модели в ONNX с динамическим размером батча
+
+    Аргументы:
+        model_path: путь к чекпоинту .pth
+        output_path: путь для сохранения графа (.onnx)
+        opset_version: версия набора операций ONNX
+    """
+    model, class_names = load_model(model_path, 'cpu')
+    example = torch.zeros(1, 1, 64, 64)
+    torch.onnx.export(
+        model, example, output_path,
+        input_names=['input'],
+        output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+        opset_version=opset_version
+    )
+    _save_metadata(output_path, class_names)
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Экспорт классификатора в TorchScript / ONNX")
+    parser.add_argument("model_path", nargs="?", default="../models/classifier_cnn.pth")
+    parser.add_argument("--format", choices=["torchscript", "onnx", "all"], default="all")
+    args = parser.parse_args()
+
+    root = os.path.splitext(args.model_path)[0]
+    if args.format in ("torchscript", "all"):
+        print(f"TorchScript: {export_torchscript(args.model_path, root + '.pt')}")
+    if args.format in ("onnx", "all"):
+        print(f"ONNX: {export_onnx(args.model_path, root + '.onnx')}")
@@ -1,14 +1,39 @@
+import os
+import json
+import warnings
+from collections import OrderedDict
+import cv2
 import torch
 from torchvision import transforms
 from PIL import Image
-from model import initialize_model
 import numpy as np
 
+# Из корня репозитория (pipeline) модуль — classifier.model: имя model занято папкой model/;
+# при запуске из classifier/ — просто model
+try:
+    from classifier.model import initialize_model
+except ImportError:
+    from model import initialize_model
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
 
 def load_model(model_path, device='cpu'):
-    """Загрузка обученной модели"""
+    """Загрузка обученной модели (в том числе квантованной через quantize.py — только CPU)"""
     checkpoint = torch.load(model_path, map_location=device)
-    model = initialize_model(checkpoint['num_classes'], device)
+    quantization = checkpoint.get('quantization')
+    if quantization:
+        try:
+            from classifier.quantize import quantize_model
+        except ImportError:
+            from quantize import quantize_model
+        # Восстанавливаем структуру квантованной модели, затем загружаем int8-веса и параметры
+        model = quantize_model(initialize_model(checkpoint['num_classes'], 'cpu'), quantization)
+    else:
+        model = initialize_model(checkpoint['num_classes'], device)
     model.load_state_dict(checkpoint['model_state_dict'])
     model.eval()
     return model, checkpoint['class_names']
@@ -63,4 +88,340 @@ def predict_symbol(image_path, model_path, class_names, confidence_threshold=0.5
         'class': predicted_class,
         'confidence': confidence,
         'all_probs': {class_name: prob.item() for class_name, prob in zip(loaded_class_names, probabilities[0])}
-    }
\ No newline at end of file
+    }
+
+
+def stage_crops(crops, size=(64, 64)):
+    """
+    Приведение вырезанных символов к общему массиву uint8 (N, H, W) в оттенках серого
+
+    Аргументы:
+        crops: список массивов uint8 (grayscale или BGR) или массив формы (N, H, W)
+        size: размер входа модели (ширина, высота)
+    """
+    width, height = size
+    if isinstance(crops, np.ndarray) and crops.dtype == np.uint8 and crops.shape[1:] == (height, width):
+        # Уже уложенный батч нужного размера — без промежуточных копий
+        return crops
+
+    staging = np.empty((len(crops), height, width), dtype=np.uint8)
+    for i, crop in enumerate(crops):
+        crop = np.asarray(crop)
+        if crop.ndim == 3:
+            crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        if crop.shape == (height, width):
+            staging[i] = crop
+        else:
+            shrink = crop.shape[0] > height or crop.shape[1] > width
+            cv2.resize(crop, size, dst=staging[i],
+                       interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
+    return staging
+
+
+def preprocess_batch(crops, size=(64, 64), out=None):
+    """
+    Пакетная предобработка вырезанных символов (аналог preprocess_image для массивов)
+
+    Все символы приводятся к size в один общий буфер uint8, затем за одно
+    копирование переводятся в float32 и нормализуются на месте, как Normalize(0.5, 0.5).
+
+    Аргументы:
+        crops: список массивов uint8 (grayscale или BGR) или массив формы (N, H, W)
+        size: размер входа модели (ширина, высота)
+        out: заранее выделенный тензор (M, 1, H, W) с M >= N для повторного использования
+
+    Возвращает:
+        Тензор float32 формы (N, 1, H, W)
+    """
+    n = len(crops)
+    width, height = size
+    staging = stage_crops(crops, size)
+
+    if out is None or out.shape[0] < n:
+        out = torch.empty((n, 1, height, width), dtype=torch.float32)
+    batch = out[:n]
+    batch.copy_(torch.from_numpy(np.ascontiguousarray(staging)).unsqueeze(1))
+    batch.mul_(2.0 / 255.0).sub_(1.0)
+    return batch
+
+
+CROP_HASHES = ('exact', 'phash')
+
+
+def exact_crop_keys(staging, threshold=128):
+    """Ключи символов: бинаризованное изображение, упакованное по биту на пиксель (512 байт для 64x64)"""
+    packed = np.packbits(staging < threshold, axis=-1).reshape(len(staging), -1)
+    return [row.tobytes() for row in packed]
+
+
+def perceptual_crop_keys(staging):
+    """
+    Ключи символов: 64-битный перцептивный хеш (DCT 8x8 низких частот уменьшенного до 32x32 изображения)
+
+    В отличие от exact_crop_keys совпадает и у символов, отличающихся отдельными пикселями.
+    """
+    keys = []
+    for crop in staging:
+        small = cv2.resize(crop, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+        low = cv2.dct(small)[:8, :8].ravel()
+        keys.append(np.packbits(low > np.median(low[1:])).tobytes())
+    return keys
+
+
+def load_export_metadata(export_path):
+    """Загрузка названий классов, сохраненных рядом с экспортированной моделью (export_model.py)"""
+    with open(export_path + '.json', 'r', encoding='utf-8') as f:
+        return json.load(f)['class_names']
+
+
+# Запрошенные при первой настройке (num_threads, interop_threads); None — еще не настраивалось
+_runtime_threads = None
+
+
+def configure_runtime(num_threads=None, interop_threads=None):
+    """
+    Настройка потоков PyTorch для инференса; применяется один раз на процесс
+
+    Повторный вызов с другими значениями ничего не меняет и выдает предупреждение.
+
+    Аргументы:
+        num_threads: число потоков внутри операций (torch.set_num_threads), None — по умолчанию
+        interop_threads: число потоков между операциями (torch.set_num_interop_threads),
+            None — по умолчанию
+    """
+    global _runtime_threads
+    if _runtime_threads is not None:
+        if (num_threads, interop_threads) != _runtime_threads:
+            warnings.warn(f"Потоки PyTorch уже настроены как {_runtime_threads} (num_threads, interop_threads); "
+                          f"запрошенные {(num_threads, interop_threads)} не применены", RuntimeWarning)
+        return
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # PyTorch позволяет менять это значение только до начала параллельной работы
+            warnings.warn(f"torch.set_num_interop_threads({interop_threads}) не применен: "
+                          f"параллельная работа PyTorch уже началась", RuntimeWarning)
+    _runtime_threads = (num_threads, interop_threads)
+
+
+class EagerBackend:
+    """Исполнение модели в обычном (eager) режиме PyTorch из чекпоинта .pth"""
+
+    def __init__(self, model_path, device='cpu', channels_last=False, num_threads=None, interop_threads=None):
+        # Потоки PyTorch общие для процесса и задаются configure_runtime
+        self.device = device
+        self.channels_last = channels_last
+        self.model, self.class_names = load_model(model_path, device)
+        if channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+
+    def __call__(self, batch):
+        batch = batch.to(self.device)
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        return self.model(batch)
+
+
+class TorchScriptBackend:
+    """Исполнение экспортированного графа TorchScript (.pt)"""
+
+    def __init__(self, model_path, device='cpu', channels_last=False, num_threads=None, interop_threads=None):
+        # Потоки PyTorch общие для процесса и задаются configure_runtime
+        self.device = device
+        self.channels_last = channels_last
+        self.model = torch.jit.load(model_path, map_location=device)
+        self.model.eval()
+        self.class_names = load_export_metadata(model_path)
+
+    def __call__(self, batch):
+        batch = batch.to(self.device)
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        return self.model(batch)
+
+
+class OnnxRuntimeBackend:
+    """Исполнение экспортированного графа ONNX (.onnx) через onnxruntime на CPU"""
+
+    def __init__(self, model_path, device='cpu', channels_last=False, num_threads=None, interop_threads=None):
+        if onnxruntime is None:
+            raise ImportError("Для ONNX-модели нужен пакет onnxruntime")
+        # Без явных значений onnxruntime занимает все ядра и конкурирует с пулом страниц
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        if interop_threads:
+            options.inter_op_num_threads = interop_threads
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options,
+                                                    providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.class_names = load_export_metadata(model_path)
+
+    def __call__(self, batch):
+        logits = self.session.run(None, {self.input_name: batch.cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+
+BACKENDS = {
+    'eager': EagerBackend,
+    'torchscript': TorchScriptBackend,
+    'onnx': OnnxRuntimeBackend,
+}
+
+
+def resolve_backend(model_path, backend='auto'):
+    """
+    Выбор способа исполнения и файла модели (см. create_backend)
+
+    Возвращает:
+        (путь к файлу, который будет загружен, название способа исполнения)
+    """
+    if backend == 'auto':
+        root, ext = os.path.splitext(model_path)
+        if ext == '.onnx':
+            if onnxruntime is None and os.path.exists(root + '.pt'):
+                model_path, backend = root + '.pt', 'torchscript'
+            else:
+                backend = 'onnx'
+        elif ext == '.pt':
+            backend = 'torchscript'
+        else:
+            backend = 'eager'
+    return model_path, backend
+
+
+def create_backend(model_path, backend='auto', device='cpu', channels_last=False,
+                   num_threads=None, interop_threads=None):
+    """
+    Создание исполнителя модели
+
+    Аргументы:
+        model_path: путь к чекпоинту .pth или экспортированной модели (.pt / .onnx)
+        backend: 'eager', 'torchscript', 'onnx' или 'auto' — выбор по расширению файла;
+            для .onnx без установленного onnxruntime используется TorchScript-версия
+            с тем же именем (.pt), если она есть
+        device: устройство для вычислений (cpu/cuda)
+        channels_last: хранить веса и входы в формате channels_last (eager / TorchScript)
+        num_threads, interop_threads: потоки сессии onnxruntime (intra_op / inter_op);
+            для eager и TorchScript потоки задаются configure_runtime
+
+    Возвращает:
+        Вызываемый объект batch -> logits с атрибутом class_names
+    """
+    model_path, backend = resolve_backend(model_path, backend)
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный способ исполнения модели: {backend}")
+    return BACKENDS[backend](model_path, device, channels_last, num_threads, interop_threads)
+
+
+class SymbolPredictor:
+    """
+    Классификатор символов, который загружает модель один раз
+    и обрабатывает вырезанные символы батчами прямо из памяти
+    """
+
+    def __init__(self, model_path, device='cpu', batch_size=64, top_k=3, backend='auto',
+                 num_threads=None, interop_threads=None, channels_last=False,
+                 crop_cache_size=0, crop_hash='exact'):
+        """
+        Аргументы:
+            model_path: путь к сохраненной модели (.pth) или экспортированной (.pt / .onnx)
+            device: устройство для вычислений (cpu/cuda)
+            batch_size: размер мини-батча при прогоне через модель
+            top_k: сколько наиболее вероятных классов возвращать
+            backend: способ исполнения модели (см. create_backend)
+            num_threads, interop_threads: потоки PyTorch (см. configure_runtime) или сессии onnxruntime
+            channels_last: формат памяти channels_last для весов и входов
+            crop_cache_size: сколько уникальных символов помнить (LRU); 0 — без кеша.
+                Одинаковые символы прогоняются через модель один раз
+            crop_hash: ключ кеша — 'exact' (бинаризованные пиксели) или 'phash' (перцептивный хеш)
+        """
+        if crop_hash not in CROP_HASHES:
+            raise ValueError(f"Неизвестный способ хеширования символов: {crop_hash}")
+        configure_runtime(num_threads, interop_threads)
+        self.device = device
+        self.batch_size = batch_size
+        self.top_k = top_k
+        self.backend = create_backend(model_path, backend, device, channels_last, num_threads, interop_threads)
+        self.class_names = self.backend.class_names
+        # Буфер входного батча переиспользуется между вызовами
+        self._input_buffer = torch.empty((batch_size, 1, 64, 64), dtype=torch.float32)
+        self.crop_cache_size = crop_cache_size
+        self._crop_keys = exact_crop_keys if crop_hash == 'exact' else perceptual_crop_keys
+        self._crop_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def predict(self, crops):
+        """
+        Предсказание классов для набора символов
+
+        Аргументы:
+            crops: список массивов uint8 (обычно 64x64, иначе приводятся к 64x64)
+                или массив формы (N, 64, 64)
+
+        Возвращает:
+            Список словарей {'class', 'confidence', 'top_k'} в порядке входа,
+            где top_k — список пар (класс, вероятность)
+        """
+        if len(crops) == 0:
+            return []
+        staging = stage_crops(crops)
+        if not self.crop_cache_size:
+            return self._predict_staged(staging)
+
+        # Символы, которых нет в кеше, группируются по ключу: модель видит каждый уникальный символ один раз
+        results = [None] * len(staging)
+        pending = {}
+        for i, key in enumerate(self._crop_keys(staging)):
+            cached = self._crop_cache.get(key)
+            if cached is not None:
+                self._crop_cache.move_to_end(key)
+                results[i] = cached
+            else:
+                pending.setdefault(key, []).append(i)
+
+        if pending:
+            first = np.fromiter((indices[0] for indices in pending.values()), dtype=np.intp, count=len(pending))
+            for (key, indices), result in zip(pending.items(), self._predict_staged(staging[first])):
+                self._crop_cache[key] = result
+                for i in indices:
+                    results[i] = result
+            while len(self._crop_cache) > self.crop_cache_size:
+                self._crop_cache.popitem(last=False)
+
+        self.cache_misses += len(pending)
+        self.cache_hits += len(staging) - len(pending)
+        # Копии записей кеша вместе со списком top_k: изменения у вызывающего кода не портят кеш
+        return [{**result, 'top_k': list(result['top_k'])} for result in results]
+
+    def cache_stats(self):
+        """Статистика кеша символов: попадания, промахи (прогоны через модель), доля попаданий, размер"""
+        total = self.cache_hits + self.cache_misses
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'hit_rate': self.cache_hits / total if total else 0.0,
+            'size': len(self._crop_cache)
+        }
+
+    def _predict_staged(self, staging):
+        """Прогон массива uint8 (N, 64, 64) через модель мини-батчами"""
+        k = min(self.top_k, len(self.class_names))
+        results = []
+        with torch.inference_mode():
+            for start in range(0, len(staging), self.batch_size):
+                batch = preprocess_batch(staging[start:start + self.batch_size], out=self._input_buffer)
+                probabilities = torch.nn.functional.softmax(self.backend(batch).float(), dim=1)
+                top_probs, top_indices = torch.topk(probabilities, k, dim=1)
+                for probs, indices in zip(top_probs.tolist(), top_indices.tolist()):
+                    top = [(self.class_names[i], p) for i, p in zip(indices, probs)]
+                    results.append({
+                        'class': top[0][0],
+                        'confidence': top[0][1],
+                        'top_k': top
+                    })
+        return results
@@ -0,0 +1,150 @@
+import io
+import os
+import copy
+import time
+import argparse
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+from torchvision import transforms, datasets
+from torch.ao.quantization import QConfigMapping, get_default_qconfig, default_dynamic_qconfig, quantize_dynamic
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+try:
+    from classifier.model import initialize_model
+except ImportError:
+    from model import initialize_model
+
+QUANTIZATION_MODES = ('dynamic', 'static')
+
+
+def _select_engine():
+    """Выбор движка квантованных операций: fbgemm для x86, иначе qnnpack (ARM)"""
+    engines = torch.backends.quantized.supported_engines
+    if 'fbgemm' in engines:
+        torch.backends.quantized.engine = 'fbgemm'
+    elif 'qnnpack' in engines:
+        torch.backends.quantized.engine = 'qnnpack'
+    return torch.backends.quantized.engine
+
+
+def quantize_model(model, mode, calibration_loader=None):
+    """
+    Пост-тренировочная int8-квантизация классификатора
+
+    Аргументы:
+        model: обученная модель MusicSymbolClassifier
+        mode: 'dynamic' — динамическая квантизация Linear (fc1, fc2);
+              'static' — статическая квантизация сверточных слоев по калибровочным
+              данным, Linear — динамически
+        calibration_loader: DataLoader с калибровочными изображениями (для 'static');
+            без него получается структура с параметрами по умолчанию — так
+            load_model восстанавливает модель перед загрузкой весов
+
+    Возвращает:
+        Квантованная модель (CPU, режим eval)
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Неизвестный режим квантизации: {mode}")
+
+    engine = _select_engine()
+    model = copy.deepcopy(model).cpu().eval()
+
+    if mode == 'dynamic':
+        return quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+    qconfig_mapping = (QConfigMapping()
+                       .set_global(get_default_qconfig(engine))
+                       .set_object_type(nn.Linear, default_dynamic_qconfig))
+    prepared = prepare_fx(model, qconfig_mapping, (torch.zeros(1, 1, 64, 64),))
+    if calibration_loader is not None:
+        with torch.no_grad():
+            for images, _ in calibration_loader:
+                prepared(images)
+    return convert_fx(prepared)
+
+
+def evaluate(model, loader):
+    """Точность (%) и среднее время на батч (мс)"""
+    correct = 0
+    total = 0
+    elapsed = 0.0
+    with torch.no_grad():
+        for images, labels in loader:
+            start = time.perf_counter()
+            outputs = model(images)
+            elapsed += time.perf_counter() - start
+            correct += (outputs.argmax(dim=1) == labels).sum().item()
+            total += labels.size(0)
+    return 100 * correct / total, 1000 * elapsed / len(loader)
+
+
+def single_symbol_latency(model, repeats=200):
+    """Среднее время предсказания одного символа (мс)"""
+    image = torch.zeros(1, 1, 64, 64)
+    with torch.no_grad():
+        for _ in range(10):
+            model(image)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(image)
+    return 1000 * (time.perf_counter() - start) / repeats
+
+
+def _state_dict_size_mb(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 2 ** 20
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пост-тренировочная int8-квантизация классификатора")
+    parser.add_argument("--model", default="../models/classifier_cnn.pth")
+    parser.add_argument("--output", default="../models/classifier_cnn_int8.pth")
+    parser.add_argument("--mode", choices=QUANTIZATION_MODES, default="dynamic")
+    parser.add_argument("--data-dir", default="../dataset")
+    parser.add_argument("--calibration-batches", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    transform = transforms.Compose([
+        transforms.Grayscale(),
+        transforms.Resize((64, 64)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=[0.5], std=[0.5])
+    ])
+    val_dataset = datasets.ImageFolder(root=os.path.join(args.data_dir, 'val'), transform=transform)
+    val_loader = DataLoader(val_dataset, batch_size=args.batch_size, shuffle=False)
+
+    checkpoint = torch.load(args.model, map_location='cpu')
+    float_model = initialize_model(checkpoint['num_classes'], 'cpu')
+    float_model.load_state_dict(checkpoint['model_state_dict'])
+    float_model.eval()
+
+    calibration = None
+    if args.mode == 'static':
+        calibration = [batch for _, batch in zip(range(args.calibration_batches), val_loader)]
+    quantized_model = quantize_model(float_model, args.mode, calibration)
+
+    torch.save({
+        'model_state_dict': quantized_model.state_dict(),
+        'class_names': checkpoint['class_names'],
+        'num_classes': checkpoint['num_classes'],
+        'quantization': args.mode
+    }, args.output)
+
+    float_acc, float_batch_ms = evaluate(float_model, val_loader)
+    quant_acc, quant_batch_ms = evaluate(quantized_model, val_loader)
+    float_single_ms = single_symbol_latency(float_model)
+    quant_single_ms = single_symbol_latency(quantized_model)
+
+    print(f"Квантизация: {args.mode} (движок {torch.backends.quantized.engine}), "
+          f"валидация: {len(val_dataset)} изображений")
+    print(f"{'':<24} {'fp32':>10} {'int8':>10} {'разница':>10}")
+    print(f"{'Точность, %':<24} {float_acc:>10.2f} {quant_acc:>10.2f} {quant_acc - float_acc:>+10.2f}")
+    print(f"{'Батч ' + str(args.batch_size) + ', мс':<24} {float_batch_ms:>10.2f} {quant_batch_ms:>10.2f} "
+          f"{float_batch_ms / quant_batch_ms:>9.2f}x")
+    print(f"{'Один символ, мс':<24} {float_single_ms:>10.3f} {quant_single_ms:>10.3f} "
+          f"{float_single_ms / quant_single_ms:>9.2f}x")
+    print(f"{'Размер весов, МБ':<24} {_state_dict_size_mb(float_model):>10.2f} "
+          f"{_state_dict_size_mb(quantized_model):>10.2f}")
+    print(f"Квантованная модель сохранена: {args.output}")
@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('torchvision')
+pytest.importorskip('cv2')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from model import initialize_model
+import predict
+from predict import create_backend, configure_runtime, onnxruntime
+from export_model import export_torchscript, export_onnx
+from bench_backends import check_parity
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    # Случайно инициализированная модель в формате чекпоинта train.py
+    torch.manual_seed(0)
+    num_classes = 5
+    path = str(tmp_path / 'classifier_cnn.pth')
+    torch.save({
+        'model_state_dict': initialize_model(num_classes, 'cpu').state_dict(),
+        'class_names': [f'class_{i}' for i in range(num_classes)],
+        'num_classes': num_classes
+    }, path)
+    return path
+
+
+def test_exported_backends_match_eager(model_path, tmp_path):
+    backends = {
+        'eager': create_backend(model_path, 'eager'),
+        'torchscript': create_backend(export_torchscript(model_path, str(tmp_path / 'model.pt')), 'torchscript')
+    }
+    if onnxruntime is not None:
+        backends['onnx'] = create_backend(export_onnx(model_path, str(tmp_path / 'model.onnx')), 'onnx')
+
+    check_parity(backends, atol=1e-4, samples=16)
+    assert all(backend.class_names == backends['eager'].class_names for backend in backends.values())
+
+
+def test_configure_runtime_warns_on_different_threads(monkeypatch):
+    monkeypatch.setattr(predict, '_runtime_threads', (2, 1))
+    with pytest.warns(RuntimeWarning):
+        configure_runtime(4, 1)
+    assert predict._runtime_threads == (2, 1)
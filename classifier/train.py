@@ -1,10 +1,14 @@
 import os
+import sys
+import random
 import torch
 import torch.nn as nn
 import torch.optim as optim
 from torch.utils.data import DataLoader
 from torchvision import transforms, datasets
 from model import initialize_model
+from dataset_cache import pack_dataset, dataset_fingerprint, MemmapImageDataset
+from batch_augment import BatchRandomAffine
 import numpy as np
 
 
@@ -12,126 +16,300 @@ import numpy as np
 class Config:
     data_dir = "../dataset"
     model_save_path = "../models/classifier_cnn.pth"
+    use_dataset_cache = True  # декодировать изображения один раз в memory-mapped кеш
+    cache_dir = "../dataset_cache"
+    batch_augment = True  # случайный поворот/сдвиг для всего батча сразу, а не по одному изображению
+    num_workers = 2
+    pin_memory = torch.cuda.is_available()
+    persistent_workers = True  # учитывается только при num_workers > 0
+    lazy_augment = False  # Albumentations-аугментация на лету вместо train_augmented на диске
+    lazy_expansion_factor = 4  # оригинал + 3 аугментации, как у MusicSymbolAugmenter
+    augment_seed = 0
     batch_size = 32
+    grad_accum_steps = 1  # эффективный батч = batch_size * grad_accum_steps
+    val_batch_size = 256
+    use_bf16 = False  # bf16 autocast для forward (CPU с AVX512-BF16/AMX или CUDA)
     num_epochs = 50
     learning_rate = 0.001
+    lr_reduce_factor = 0.5  # ReduceLROnPlateau по val loss
+    lr_reduce_patience = 3
+    early_stopping_patience = 8  # остановка, если val loss не улучшается столько эпох
+    early_stopping_min_delta = 1e-4
+    checkpoint_path = "../models/classifier_checkpoint.pth"  # полное состояние для продолжения
+    checkpoint_every = 1  # сохранять состояние каждые N эпох
+    resume = True  # продолжить с checkpoint_path, если он есть и датасет с классами не изменились
     num_classes = 31  # Количество классов музыкальных символов
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 
 def get_dataloaders():
-    """Создание DataLoader для train и validation"""
+    """Создание DataLoader для train и валидационных тензоров"""
+
+    # Случайные преобразования по одному изображению; при batch_augment
+    # они выполняются для всего батча в train_model
+    random_transforms = [] if Config.batch_augment else [
+        transforms.RandomRotation(10),  # Случайный поворот
+        transforms.RandomAffine(0, translate=(0.1, 0.1)),  # Сдвиг
+    ]
 
     # Трансформации для изображений
     transform = transforms.Compose([
         transforms.Grayscale(),
         transforms.Resize((64, 64)),
-        transforms.RandomRotation(10),  # Случайный поворот
-        transforms.RandomAffine(0, translate=(0.1, 0.1)),  # Сдвиг
+        *random_transforms,
         transforms.ToTensor(),
         transforms.Normalize(mean=[0.5], std=[0.5])
     ])
 
     # Загрузка данных
-    train_dataset = datasets.ImageFolder(
-        root=os.path.join(Config.data_dir, 'train'),
-        transform=transform
-    )
-
-    val_dataset = datasets.ImageFolder(
-        root=os.path.join(Config.data_dir, 'val'),
-        transform=transform
-    )
+    if Config.lazy_augment:
+        train_dataset = get_lazy_train_dataset()
+    elif Config.use_dataset_cache:
+        # Изображения уже в оттенках серого и 64x64, остаются только случайные преобразования
+        cached_transform = transforms.Compose([
+            *random_transforms,
+            transforms.Normalize(mean=[0.5], std=[0.5])
+        ])
+        train_dataset = MemmapImageDataset(
+            pack_dataset(os.path.join(Config.data_dir, 'train'), os.path.join(Config.cache_dir, 'train')),
+            transform=cached_transform
+        )
+    else:
+        train_dataset = datasets.ImageFolder(
+            root=os.path.join(Config.data_dir, 'train'),
+            transform=transform
+        )
 
     # DataLoader
     train_loader = DataLoader(
         train_dataset,
         batch_size=Config.batch_size,
         shuffle=True,
-        drop_last=True
+        drop_last=True,
+        num_workers=Config.num_workers,
+        pin_memory=Config.pin_memory,
+        persistent_workers=Config.persistent_workers and Config.num_workers > 0
     )
 
-    val_loader = DataLoader(
-        val_dataset,
-        batch_size=Config.batch_size,
-        shuffle=False
-    )
-
-    return train_loader, val_loader, train_dataset.classes
+    return train_loader, get_val_tensors(), train_dataset.classes
+
+
+def get_val_tensors():
+    """
+    Валидационные изображения без аугментации, подготовленные один раз
+
+    Возвращает:
+        (изображения (N, 1, 64, 64) после Normalize, метки (N,)) на Config.device
+    """
+    val_path = os.path.join(Config.data_dir, 'val')
+    if Config.use_dataset_cache:
+        cached = MemmapImageDataset(pack_dataset(val_path, os.path.join(Config.cache_dir, 'val')))
+        images = torch.from_numpy(np.asarray(cached.images, dtype=np.float32)).unsqueeze(1).div_(255.0)
+        labels = torch.from_numpy(cached.labels)
+    else:
+        val_dataset = datasets.ImageFolder(root=val_path, transform=transforms.Compose([
+            transforms.Grayscale(),
+            transforms.Resize((64, 64)),
+            transforms.ToTensor()
+        ]))
+        images = torch.stack([image for image, _ in val_dataset])
+        labels = torch.tensor(val_dataset.targets)
+
+    # Normalize(mean=0.5, std=0.5)
+    images = images.sub_(0.5).div_(0.5)
+    return images.to(Config.device), labels.to(Config.device)
+
+
+def autocast():
+    """bf16 autocast при Config.use_bf16 (на CPU эффективен при поддержке AVX512-BF16/AMX)"""
+    return torch.autocast(device_type=Config.device.type, dtype=torch.bfloat16, enabled=Config.use_bf16)
+
+
+def evaluate(model, val_images, val_labels, criterion):
+    """Потери и точность (%) на валидации за один проход по подготовленным тензорам"""
+    model.eval()
+    total_loss = torch.zeros((), device=val_labels.device)
+    correct = torch.zeros((), dtype=torch.long, device=val_labels.device)
+
+    with torch.inference_mode(), autocast():
+        for start in range(0, len(val_labels), Config.val_batch_size):
+            images = val_images[start:start + Config.val_batch_size]
+            labels = val_labels[start:start + Config.val_batch_size]
+            outputs = model(images).float()
+            total_loss += criterion(outputs, labels) * labels.size(0)
+            correct += (outputs.argmax(dim=1) == labels).sum()
+
+    # Одна синхронизация на всю валидацию
+    return total_loss.item() / len(val_labels), 100 * correct.item() / len(val_labels)
+
+
+def get_lazy_train_dataset():
+    """Тренировочный датасет с аугментацией MusicSymbolAugmenter.train_transform на лету"""
+    # Пакет augmentation находится в корне репозитория
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from augmentation.augment_dataset import MusicSymbolAugmenter
+    from augmentation.lazy_dataset import AugmentedSymbolDataset
+
+    options = {
+        'expansion_factor': Config.lazy_expansion_factor,
+        'seed': Config.augment_seed,
+        'tensor_transform': transforms.Normalize(mean=[0.5], std=[0.5])
+    }
+    train_transform = MusicSymbolAugmenter().train_transform
+    train_path = os.path.join(Config.data_dir, 'train')
+
+    if Config.use_dataset_cache:
+        cached = MemmapImageDataset(pack_dataset(train_path, os.path.join(Config.cache_dir, 'train')))
+        return AugmentedSymbolDataset(cached.images, cached.labels, train_transform,
+                                      classes=cached.classes, **options)
+    return AugmentedSymbolDataset.from_folder(train_path, train_transform, **options)
+
+
+def data_fingerprint():
+    """Отпечаток train/ и val/ в Config.data_dir: чекпоинт другого датасета не продолжается"""
+    return '|'.join(dataset_fingerprint(os.path.join(Config.data_dir, split)) for split in ('train', 'val'))
+
+
+def save_checkpoint(epoch, model, optimizer, scheduler, progress, class_names, fingerprint, finished=False):
+    """
+    Полное состояние обучения: модель, оптимизатор, планировщик, эпоха,
+    лучшие метрики, отпечаток датасета и состояние генераторов случайных чисел
+    """
+    state = {
+        'epoch': epoch,
+        'finished': finished,
+        'dataset_fingerprint': fingerprint,
+        'model_state_dict': model.state_dict(),
+        'optimizer_state_dict': optimizer.state_dict(),
+        'scheduler_state_dict': scheduler.state_dict(),
+        'progress': progress,
+        'class_names': class_names,
+        'num_classes': Config.num_classes,
+        'rng_state': {
+            'python': random.getstate(),
+            'numpy': np.random.get_state(),
+            'torch': torch.get_rng_state(),
+            'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None
+        }
+    }
+    # Через временный файл: прерывание во время записи не портит предыдущее состояние
+    tmp_path = Config.checkpoint_path + ".tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, Config.checkpoint_path)
+
+
+def load_checkpoint(model, optimizer, scheduler, class_names, fingerprint):
+    """
+    Восстановление состояния из Config.checkpoint_path
+
+    Возвращает словарь чекпоинта или None, если продолжать нечего: обучение
+    в чекпоинте завершено либо датасет или список классов с тех пор изменились.
+    """
+    state = torch.load(Config.checkpoint_path, map_location='cpu', weights_only=False)
+    if state['finished']:
+        print(f"Обучение в {Config.checkpoint_path} завершено, начинаем заново")
+        return None
+    if state.get('class_names') != class_names or state.get('dataset_fingerprint') != fingerprint:
+        print(f"Датасет или классы изменились с момента {Config.checkpoint_path}, начинаем заново")
+        return None
+
+    model.load_state_dict(state['model_state_dict'])
+    optimizer.load_state_dict(state['optimizer_state_dict'])
+    scheduler.load_state_dict(state['scheduler_state_dict'])
+
+    rng_state = state['rng_state']
+    random.setstate(rng_state['python'])
+    np.random.set_state(rng_state['numpy'])
+    torch.set_rng_state(rng_state['torch'])
+    if rng_state['cuda'] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(rng_state['cuda'])
+    return state
 
 
 def train_model():
     """Обучение модели классификации"""
 
     # Получение данных
-    train_loader, val_loader, class_names = get_dataloaders()
+    train_loader, (val_images, val_labels), class_names = get_dataloaders()
 
     # Инициализация модели
     model = initialize_model(Config.num_classes, Config.device)
     criterion = nn.CrossEntropyLoss()
     optimizer = optim.Adam(model.parameters(), lr=Config.learning_rate)
-
-    best_accuracy = 0.0
+    # При lazy_augment поворот и сдвиг уже входят в Albumentations-трансформацию
+    augment = None
+    if Config.batch_augment and not Config.lazy_augment:
+        augment = BatchRandomAffine(degrees=10, translate=(0.1, 0.1))
+
+    scheduler = optim.lr_scheduler.ReduceLROnPlateau(
+        optimizer, mode='min', factor=Config.lr_reduce_factor, patience=Config.lr_reduce_patience)
+
+    progress = {
+        'best_accuracy': 0.0,
+        'best_val_loss': float('inf'),
+        'epochs_without_improvement': 0
+    }
+    start_epoch = 0
+    fingerprint = data_fingerprint()
+
+    state = None
+    if Config.resume and os.path.exists(Config.checkpoint_path):
+        state = load_checkpoint(model, optimizer, scheduler, list(class_names), fingerprint)
+    if state is not None:
+        progress = state['progress']
+        start_epoch = state['epoch'] + 1
+        print(f"Продолжение с эпохи {start_epoch + 1} ({Config.checkpoint_path})")
 
     print(f"Обучение на устройстве: {Config.device}")
     print(f"Количество классов: {Config.num_classes}")
     print(f"Размер тренировочного батча: {len(train_loader.dataset)}")
-    print(f"Размер валидационного батча: {len(val_loader.dataset)}")
+    print(f"Размер валидационного батча: {len(val_labels)}")
+    print(f"Эффективный батч: {Config.batch_size * Config.grad_accum_steps}, bf16: {Config.use_bf16}")
 
-    for epoch in range(Config.num_epochs):
+    for epoch in range(start_epoch, Config.num_epochs):
         # Режим обучения
         model.train()
-        running_loss = 0.0
+        running_loss = torch.zeros((), device=Config.device)
+        if hasattr(train_loader.dataset, 'set_epoch'):
+            train_loader.dataset.set_epoch(epoch)
 
-        for images, labels in train_loader:
-            images = images.to(Config.device)
-            labels = labels.to(Config.device)
+        # Обнуление градиентов
+        optimizer.zero_grad(set_to_none=True)
 
-            # Обнуление градиентов
-            optimizer.zero_grad()
+        for step, (images, labels) in enumerate(train_loader, 1):
+            images = images.to(Config.device, non_blocking=Config.pin_memory)
+            labels = labels.to(Config.device, non_blocking=Config.pin_memory)
+            if augment is not None:
+                images = augment(images)
 
             # Forward pass
-            outputs = model(images)
-            loss = criterion(outputs, labels)
+            with autocast():
+                outputs = model(images)
+                loss = criterion(outputs.float(), labels)
 
-            # Backward pass и оптимизация
-            loss.backward()
-            optimizer.step()
+            # Backward pass; градиенты накапливаются grad_accum_steps батчей
+            (loss / Config.grad_accum_steps).backward()
+            if step % Config.grad_accum_steps == 0 or step == len(train_loader):
+                optimizer.step()
+                optimizer.zero_grad(set_to_none=True)
 
-            running_loss += loss.item() * images.size(0)
+            running_loss += loss.detach() * images.size(0)
 
         # Валидация
-        model.eval()
-        val_loss = 0.0
-        correct = 0
-        total = 0
-
-        with torch.no_grad():
-            for images, labels in val_loader:
-                images = images.to(Config.device)
-                labels = labels.to(Config.device)
-
-                outputs = model(images)
-                loss = criterion(outputs, labels)
-                val_loss += loss.item() * images.size(0)
-
-                _, predicted = torch.max(outputs.data, 1)
-                total += labels.size(0)
-                correct += (predicted == labels).sum().item()
+        val_loss, val_accuracy = evaluate(model, val_images, val_labels, criterion)
 
         # Статистика эпохи
-        train_loss = running_loss / len(train_loader.dataset)
-        val_loss = val_loss / len(val_loader.dataset)
-        val_accuracy = 100 * correct / total
+        train_loss = running_loss.item() / len(train_loader.dataset)
 
         print(f"Epoch {epoch + 1}/{Config.num_epochs} | "
               f"Train Loss: {train_loss:.4f} | "
               f"Val Loss: {val_loss:.4f} | "
-              f"Val Acc: {val_accuracy:.2f}%")
+              f"Val Acc: {val_accuracy:.2f}% | "
+              f"LR: {optimizer.param_groups[0]['lr']:.2e}")
 
         # Сохранение лучшей модели
-        if val_accuracy > best_accuracy:
-            best_accuracy = val_accuracy
+        if val_accuracy > progress['best_accuracy']:
+            progress['best_accuracy'] = val_accuracy
             torch.save({
                 'model_state_dict': model.state_dict(),
                 'class_names': class_names,
@@ -139,7 +317,23 @@ def train_model():
             }, Config.model_save_path)
             print(f"Модель сохранена с точностью {val_accuracy:.2f}%")
 
-    print(f"Обучение завершено. Лучшая точность: {best_accuracy:.2f}%")
+        # Планировщик и ранняя остановка по val loss
+        scheduler.step(val_loss)
+        if val_loss < progress['best_val_loss'] - Config.early_stopping_min_delta:
+            progress['best_val_loss'] = val_loss
+            progress['epochs_without_improvement'] = 0
+        else:
+            progress['epochs_without_improvement'] += 1
+
+        stop = progress['epochs_without_improvement'] >= Config.early_stopping_patience
+        if stop or (epoch + 1) % Config.checkpoint_every == 0 or epoch + 1 == Config.num_epochs:
+            save_checkpoint(epoch, model, optimizer, scheduler, progress, class_names, fingerprint,
+                            finished=stop or epoch + 1 == Config.num_epochs)
+        if stop:
+            print(f"Ранняя остановка: val loss не улучшается {Config.early_stopping_patience} эпох")
+            break
+
+    print(f"Обучение завершено. Лучшая точность: {progress['best_accuracy']:.2f}%")
 
 
 if __name__ == "__main__":
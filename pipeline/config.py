@@ -1,5 +1,15 @@
 # Пути к моделям
 CLASSIFIER_MODEL_PATH = "models/classifier_cnn.pth"
+CLASSIFIER_BACKEND = "auto"  # "eager", "torchscript", "onnx" или "auto" (по расширению файла модели)
+
+# Инференс классификатора (применяется один раз при создании SymbolPredictor)
+# Классификация идет в основном процессе параллельно с пулом страниц, поэтому потоков немного
+INFERENCE_NUM_THREADS = 2  # torch.set_num_threads / intra_op onnxruntime; None — по умолчанию (все ядра)
+INFERENCE_INTEROP_THREADS = 1  # torch.set_num_interop_threads / inter_op onnxruntime
+INFERENCE_CHANNELS_LAST = False
+INFERENCE_BATCH_SIZE = 64
+CLASSIFIER_CROP_CACHE_SIZE = 4096  # уникальных символов в кеше перед классификатором; 0 — без кеша
+CLASSIFIER_CROP_HASH = "exact"  # "exact" (бинаризованные пиксели) или "phash" (перцептивный хеш)
 
 # Пути к данным
 DATASET_PATH = "dataset/"
@@ -8,6 +18,21 @@ OUTPUT_XML_PATH = "output/result.musicxml"
 # Параметры изображений
 SYMBOL_IMAGE_SIZE = (64, 64)
 STAFF_PADDING = 10
+STAFF_LINE_ENGINE = "morphology"  # "morphology" или "projection" (быстрее на чистых нотах)
+STAFF_COARSE_SCALE = None  # например 0.25 для сканов 600 DPI: станы ищутся на уменьшенной странице
+
+# Растеризация PDF
+PDF_DPI = 300
+PDF_PAGE_WINDOW = 1  # сколько страниц растеризуется за один вызов poppler
+
+# Параллельная обработка страниц
+PAGE_WORKERS = None  # число процессов; None — ядра за вычетом INFERENCE_NUM_THREADS, 1 — без пула
+PAGE_CHUNK_SIZE = 1  # сколько страниц отдаётся процессу за одну задачу
+
+# Кеш результатов распознавания страниц
+PIPELINE_VERSION = "1"  # увеличить при изменении детекции станов или символов — старый кеш перестанет совпадать
+RESULT_CACHE_DIR = "pipeline_cache"  # None — без кеша
+RESULT_CACHE_MAX_MB = 512
 
 # Флаги
 DEBUG = True
@@ -16,6 +41,8 @@ SAVE_INTERMEDIATE_IMAGES = False
 # Экспорт
 MUSICXML_AUTHOR = "AutoGenerated"
 MUSICXML_TITLE = "Untitled"
+MUSICXML_BACKEND = "etree"  # "etree" (без music21, быстрый) или "music21"
+MUSICXML_COMPRESS_LEVEL = 6  # уровень zlib для .mxl (выход с расширением .mxl сжимается)
 
 # Прочее
 MIN_SYMBOL_CONFIDENCE = 0.7
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+executor.py — параллельная обработка страниц:
+- детекция станов и извлечение символов для каждой страницы в отдельном процессе
+- сборка результатов обратно в порядке страниц
+- страницы, найденные в кеше результатов, не отправляются в пул
+- OpenCV в воркерах однопоточный, ядра за вычетом потоков классификатора отдаются пулу
+"""
+
+import os
+import cv2
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from pipeline.config import (PAGE_WORKERS, PAGE_CHUNK_SIZE, SAVE_INTERMEDIATE_IMAGES,
+                             STAFF_LINE_ENGINE, STAFF_COARSE_SCALE, INFERENCE_NUM_THREADS)
+from staff_detector.split_staffs import extract_staff_regions
+from symbol_detector.extract_symbols import extract_symbols_from_staff
+
+
+def process_page(page):
+    """
+    Детекция станов и извлечение символов одной страницы (выполняется в процессе-воркере)
+
+    Args:
+        page: кортеж (номер страницы, путь к изображению страницы или массив grayscale)
+
+    Returns:
+        Кортеж (номер страницы, список станов вида {'coordinates', 'symbols'}),
+        где symbols — список кортежей (изображение символа 64x64, bbox)
+    """
+    page_num, page_image = page
+    output_dir = os.path.join("pipeline_temp_staffs", f"page_{page_num + 1}") if SAVE_INTERMEDIATE_IMAGES else None
+
+    if isinstance(page_image, str):
+        staff_regions = extract_staff_regions(image_path=page_image, output_dir=output_dir,
+                                              line_engine=STAFF_LINE_ENGINE, coarse_scale=STAFF_COARSE_SCALE,
+                                              as_views=True)
+    else:
+        staff_regions = extract_staff_regions(image=page_image, output_dir=output_dir,
+                                              line_engine=STAFF_LINE_ENGINE, coarse_scale=STAFF_COARSE_SCALE,
+                                              as_views=True)
+
+    # Станы — представления одного grayscale буфера страницы, обратно передаются только символы
+    staffs = []
+    for staff in staff_regions:
+        staffs.append({
+            'coordinates': staff.coordinates,
+            'symbols': extract_symbols_from_staff(staff.image)
+        })
+    return page_num, staffs
+
+
+def _init_worker():
+    """Инициализация процесса пула"""
+    cv2.setNumThreads(1)  # параллельность уже на уровне процессов
+
+
+def default_workers():
+    """Число процессов пула: ядра, не занятые потоками классификатора в основном процессе"""
+    return max(1, (os.cpu_count() or 1) - (INFERENCE_NUM_THREADS or 0))
+
+
+def _process_chunk(chunk):
+    return [process_page(page) for page in chunk]
+
+
+def _completed(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def iter_page_results(pages, workers=PAGE_WORKERS, chunk_size=PAGE_CHUNK_SIZE, lookup=None):
+    """
+    Обработка страниц пулом процессов с выдачей результатов в порядке страниц
+
+    Args:
+        pages: последовательность или генератор страниц (пути к изображениям или массивы);
+            генератор читается по мере освобождения места в очереди задач
+        workers: число процессов (None — default_workers(), 1 — в текущем процессе)
+        chunk_size: сколько страниц передаётся процессу за одну задачу
+        lookup: функция (номер страницы, страница) -> готовый результат или None;
+            страницы с готовым результатом не отправляются в пул
+
+    Yields:
+        Кортежи (номер страницы, станы) — как возвращает process_page или lookup
+    """
+    numbered = enumerate(pages)
+    if workers == 1:
+        for page_num, page_image in numbered:
+            cached = lookup(page_num, page_image) if lookup is not None else None
+            yield (page_num, cached) if cached is not None else process_page((page_num, page_image))
+        return
+
+    workers = workers or default_workers()
+    # Ограничиваем число задач в работе, чтобы не держать в памяти результаты всего документа
+    max_pending = workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        pending = deque()
+        chunk = []
+
+        def submit_chunk():
+            if chunk:
+                pending.append(pool.submit(_process_chunk, list(chunk)))
+                chunk.clear()
+
+        for page_num, page_image in numbered:
+            cached = lookup(page_num, page_image) if lookup is not None else None
+            if cached is not None:
+                # Страницы до найденной в кеше уходят в пул, чтобы сохранить порядок
+                submit_chunk()
+                pending.append(_completed([(page_num, cached)]))
+            else:
+                chunk.append((page_num, page_image))
+                if len(chunk) >= max(1, chunk_size):
+                    submit_chunk()
+            # Готовые результаты отдаём сразу, не дожидаясь растеризации остальных страниц
+            while pending and (len(pending) >= max_pending or pending[0].done()):
+                yield from pending.popleft().result()
+        submit_chunk()
+        while pending:
+            yield from pending.popleft().result()
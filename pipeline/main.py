@@ -5,11 +5,18 @@
 """
 
 import os
-from pdf2image import convert_from_path
-from staff_detector.split_staffs import extract_staff_regions
-from symbol_detector.extract_symbols import extract_symbols
-from classifier.predict import predict_symbol
-from xml_exporter.export import MusicXMLExporter
+import numpy as np
+from pdf2image import convert_from_path, pdfinfo_from_path
+from classifier.predict import SymbolPredictor, resolve_backend
+from pipeline.config import (PAGE_WORKERS, PAGE_CHUNK_SIZE, PDF_DPI, PDF_PAGE_WINDOW, CLASSIFIER_BACKEND,
+                             INFERENCE_NUM_THREADS, INFERENCE_INTEROP_THREADS, INFERENCE_CHANNELS_LAST,
+                             INFERENCE_BATCH_SIZE, MUSICXML_BACKEND, MUSICXML_TITLE, MUSICXML_AUTHOR,
+                             CLASSIFIER_CROP_CACHE_SIZE, CLASSIFIER_CROP_HASH,
+                             MUSICXML_COMPRESS_LEVEL, RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB,
+                             STAFF_LINE_ENGINE, STAFF_COARSE_SCALE)
+from pipeline.executor import iter_page_results
+from pipeline.result_cache import PageResultCache, file_fingerprint
+from xml_exporter.export import MusicXMLExporter, StreamingMusicXMLWriter
 
 
 def pdf_to_images(pdf_path, temp_dir="pipeline_temp_images"):
@@ -23,28 +30,121 @@ def pdf_to_images(pdf_path, temp_dir="pipeline_temp_images"):
     return image_paths
 
 
-def process_pdf(pdf_path, output_xml="output.musicxml", model_path="models/classifier_cnn.pth", class_names=None):
-    image_paths = pdf_to_images(pdf_path)
+def iter_pdf_pages(pdf_path, dpi=PDF_DPI, window=PDF_PAGE_WINDOW):
+    """
+    Постраничная растеризация PDF без временных файлов
+
+    Args:
+        pdf_path: путь к PDF
+        dpi: разрешение растеризации
+        window: сколько страниц растеризуется за один вызов
+
+    Yields:
+        Страницы в виде grayscale массивов uint8; в памяти одновременно
+        находится не больше window страниц
+    """
+    page_count = pdfinfo_from_path(pdf_path)["Pages"]
+    for first_page in range(1, page_count + 1, window):
+        last_page = min(first_page + window - 1, page_count)
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=first_page,
+                                   last_page=last_page, grayscale=True)
+        for img in images:
+            yield np.asarray(img)
+        del images
+
+
+def classify_staffs(predictor, staffs):
+    """
+    Классификация символов станов страницы
+
+    Returns:
+        Список станов {'coordinates', 'symbols': [{'bbox', 'class', 'confidence'}, ...]}
+    """
+    classified = []
+    for staff in staffs:
+        symbols = staff['symbols']
+        results = predictor.predict([symbol_img for symbol_img, _ in symbols]) if symbols else []
+        classified.append({
+            'coordinates': staff['coordinates'],
+            'symbols': [{
+                'bbox': list(bbox),
+                'class': result['class'],
+                'confidence': result['confidence']
+            } for (_, bbox), result in zip(symbols, results)]
+        })
+    return classified
+
+
+def process_pdf(pdf_path, output_xml="output.musicxml", model_path="models/classifier_cnn.pth", class_names=None,
+                workers=PAGE_WORKERS, chunk_size=PAGE_CHUNK_SIZE):
+    pages = iter_pdf_pages(pdf_path)
+    # Модель загружается один раз на весь документ
+    predictor = SymbolPredictor(
+        model_path,
+        batch_size=INFERENCE_BATCH_SIZE,
+        backend=CLASSIFIER_BACKEND,
+        num_threads=INFERENCE_NUM_THREADS,
+        interop_threads=INFERENCE_INTEROP_THREADS,
+        channels_last=INFERENCE_CHANNELS_LAST,
+        crop_cache_size=CLASSIFIER_CROP_CACHE_SIZE,
+        crop_hash=CLASSIFIER_CROP_HASH
+    )
+    # etree: такты пишутся в файл по мере распознавания станов;
+    # music21 строит партитуру целиком, поэтому символы накапливаются
+    writer = None
     all_symbols = []
-    for page_num, image_path in enumerate(image_paths):
-        staff_regions = extract_staff_regions(image_path=image_path, output_dir="pipeline_temp_staffs")
-        for staff in staff_regions:
-            # staff['image'] или staff, в зависимости от реализации
-            symbols = extract_symbols(staff['image'] if isinstance(staff, dict) and 'image' in staff else staff)
-            for symbol_img, bbox in symbols:
-                result = predict_symbol(
-                    image_path=symbol_img,  # если нужен путь, иначе передай массив
-                    model_path=model_path,
-                    class_names=class_names
-                )
-                all_symbols.append({
-                    'image': symbol_img,
-                    'bbox': bbox,
-                    'class': result['class'],
-                    'confidence': result['confidence']
-                })
-    exporter = MusicXMLExporter()
-    exporter.export_from_recognition_results(all_symbols, output_xml)
+    if MUSICXML_BACKEND == "etree":
+        writer = StreamingMusicXMLWriter(output_xml, title=MUSICXML_TITLE, composer=MUSICXML_AUTHOR,
+                                         compresslevel=MUSICXML_COMPRESS_LEVEL)
+    # Кеш результатов: страницы, которые уже распознавались с той же моделью, не обрабатываются заново
+    cache = None
+    miss_keys = {}
+    if RESULT_CACHE_DIR:
+        # Ключ учитывает файл и способ исполнения, которые реально загружены (auto может выбрать .pt
+        # вместо .onnx), и хеш символов: при 'phash' похожие символы получают общий класс
+        resolved_path, resolved_backend = resolve_backend(model_path, CLASSIFIER_BACKEND)
+        crop_hash = CLASSIFIER_CROP_HASH if CLASSIFIER_CROP_CACHE_SIZE else "off"
+        cache = PageResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB * 2 ** 20,
+                                model_fingerprint=file_fingerprint(resolved_path),
+                                settings=f"{STAFF_LINE_ENGINE}|{STAFF_COARSE_SCALE}|{resolved_backend}|{crop_hash}")
+
+    def lookup(page_num, page_image):
+        key = cache.key(page_image)
+        staffs = cache.get(key)
+        if staffs is None:
+            miss_keys[page_num] = key
+        return staffs
+
+    try:
+        # Станы и символы страниц извлекаются параллельно, результаты приходят в порядке страниц
+        for page_num, staffs in iter_page_results(pages, workers=workers, chunk_size=chunk_size,
+                                                  lookup=lookup if cache is not None else None):
+            if cache is None or page_num in miss_keys:
+                staffs = classify_staffs(predictor, staffs)
+                if cache is not None:
+                    cache.put(miss_keys.pop(page_num), staffs)
+            for staff_num, staff in enumerate(staffs):
+                if not staff['symbols']:
+                    continue
+                staff_symbols = [dict(symbol, page=page_num, staff=staff_num) for symbol in staff['symbols']]
+                if writer is not None:
+                    writer.add_staff(staff_symbols)
+                else:
+                    all_symbols.extend(staff_symbols)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        exporter = MusicXMLExporter(backend=MUSICXML_BACKEND, title=MUSICXML_TITLE, composer=MUSICXML_AUTHOR,
+                                    compresslevel=MUSICXML_COMPRESS_LEVEL)
+        exporter.export_from_recognition_results(all_symbols, output_xml)
+    if CLASSIFIER_CROP_CACHE_SIZE:
+        stats = predictor.cache_stats()
+        print(f"[pipeline] Кеш символов: {stats['hits']} попаданий, {stats['misses']} прогонов модели "
+              f"({stats['hit_rate']:.0%})")
+    if cache is not None:
+        print(f"[pipeline] Кеш страниц: {cache.hits} из {cache.hits + cache.misses}")
     print(f"[pipeline] Готово! XML: {output_xml}")
 
 
@@ -56,4 +156,4 @@ if __name__ == "__main__":
         output_xml = sys.argv[2] if len(sys.argv) > 2 else "output.musicxml"
         process_pdf(pdf_path, output_xml)
     else:
-        print("Использование: python main.py <input.pdf> [output.musicxml]")
\ No newline at end of file
+        print("Использование: python main.py <input.pdf> [output.musicxml | output.mxl]")
\ No newline at end of file
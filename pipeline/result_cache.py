@@ -0,0 +1,150 @@
+"""
+result_cache.py — кеш результатов распознавания страниц на диске:
+- ключ — sha1 пикселей страницы, версии пайплайна и отпечатка модели
+- по одному сжатому .npz на страницу: станы, рамки символов, классы и уверенности
+- ограничение размера с вытеснением давно не использованных страниц (LRU по mtime)
+"""
+
+import os
+import hashlib
+import numpy as np
+
+from pipeline.config import PIPELINE_VERSION
+
+
+def file_fingerprint(path, block_size=1 << 20):
+    """sha1 содержимого файла (например, весов модели)"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PageResultCache:
+    """
+    Кеш классифицированных станов страницы
+
+    Формат значения — как у process_pdf после классификации: список станов
+    {'coordinates': {...}, 'symbols': [{'bbox', 'class', 'confidence'}, ...]}.
+    """
+
+    def __init__(self, cache_dir, max_bytes, model_fingerprint="", settings=""):
+        """
+        Args:
+            cache_dir: папка кеша
+            max_bytes: максимальный суммарный размер файлов кеша
+            model_fingerprint: отпечаток модели классификатора (file_fingerprint)
+            settings: параметры детекции, влияющие на результат (движок, масштаб и т.п.)
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._salt = f"{PIPELINE_VERSION}|{model_fingerprint}|{settings}".encode('utf-8')
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, page_image):
+        """Ключ страницы: массив пикселей или путь к файлу изображения"""
+        digest = hashlib.sha1(self._salt)
+        if isinstance(page_image, str):
+            with open(page_image, 'rb') as f:
+                digest.update(f.read())
+        else:
+            page_image = np.ascontiguousarray(page_image)
+            digest.update(f"{page_image.shape}|{page_image.dtype}".encode('utf-8'))
+            digest.update(page_image.data)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def _entries(self):
+        """Готовые страницы кеша; временные файлы (.tmp) не учитываются и не вытесняются"""
+        return [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.npz')]
+
+    def get(self, key):
+        """Станы страницы или None, если страницы нет в кеше"""
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                staffs = self._unpack(data)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, KeyError):
+            # Поврежденный файл (например, прерванная запись другим процессом)
+            self._remove(path)
+            self.misses += 1
+            return None
+        # Обновляем время доступа для LRU
+        os.utime(path)
+        self.hits += 1
+        return staffs
+
+    def put(self, key, staffs):
+        path = self._path(key)
+        # Имя не оканчивается на .npz: незаконченная запись не попадает в размер кеша и в вытеснение;
+        # через файловый объект, чтобы numpy не добавил расширение
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **self._pack(staffs))
+        size = os.path.getsize(tmp_path)
+        if os.path.exists(path):
+            self._size -= os.path.getsize(path)
+        os.replace(tmp_path, path)
+        self._size += size
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Удаление давно не использованных страниц, пока размер не станет меньше max_bytes"""
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self._size <= self.max_bytes:
+                break
+            self._remove(entry.path)
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self._size -= size
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _pack(staffs):
+        coordinates = np.array([[s['coordinates'][k] for k in ('left', 'top', 'right', 'bottom')] for s in staffs],
+                               dtype=np.int32).reshape(-1, 4)
+        symbols = [(staff_num, symbol) for staff_num, staff in enumerate(staffs) for symbol in staff['symbols']]
+        return {
+            'staff_coordinates': coordinates,
+            'symbol_staff': np.array([staff_num for staff_num, _ in symbols], dtype=np.int32),
+            'symbol_boxes': np.array([symbol['bbox'] for _, symbol in symbols], dtype=np.int32).reshape(-1, 4),
+            'symbol_classes': np.array([symbol['class'] for _, symbol in symbols], dtype=np.str_),
+            'symbol_confidences': np.array([symbol['confidence'] for _, symbol in symbols], dtype=np.float32)
+        }
+
+    @staticmethod
+    def _unpack(data):
+        staffs = []
+        for left, top, right, bottom in data['staff_coordinates'].tolist():
+            staffs.append({
+                'coordinates': {
+                    'left': left,
+                    'top': top,
+                    'right': right,
+                    'bottom': bottom,
+                    'width': right - left,
+                    'height': bottom - top
+                },
+                'symbols': []
+            })
+        for staff_num, bbox, symbol_class, confidence in zip(data['symbol_staff'].tolist(),
+                                                             data['symbol_boxes'].tolist(),
+                                                             data['symbol_classes'].tolist(),
+                                                             data['symbol_confidences'].tolist()):
+            staffs[staff_num]['symbols'].append({'bbox': bbox, 'class': symbol_class, 'confidence': confidence})
+        return staffs
@@ -0,0 +1,14 @@
+import os
+import sys
+import importlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.mark.parametrize('module', ['pipeline.main', 'classifier.predict', 'classifier.quantize'])
+def test_package_imports(module):
+    for dependency in ('numpy', 'cv2', 'torch', 'torchvision', 'pdf2image'):
+        pytest.importorskip(dependency)
+    importlib.import_module(module)
@@ -0,0 +1,83 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline.result_cache import PageResultCache
+
+
+def _staff(left, top, right, bottom, symbols):
+    return {
+        'coordinates': {'left': left, 'top': top, 'right': right, 'bottom': bottom,
+                        'width': right - left, 'height': bottom - top},
+        'symbols': symbols
+    }
+
+
+@pytest.mark.parametrize('staffs', [
+    [],
+    [_staff(0, 10, 500, 90, [])],
+    [_staff(0, 10, 500, 90, [{'bbox': [5, 6, 7, 8], 'class': 'note_quarter', 'confidence': 0.5}]),
+     _staff(0, 120, 500, 200, []),
+     _staff(0, 230, 500, 310, [{'bbox': [1, 2, 3, 4], 'class': 'clef_g', 'confidence': 0.25},
+                               {'bbox': [9, 8, 7, 6], 'class': 'rest_half', 'confidence': 1.0}])],
+], ids=['no_staffs', 'empty_staff', 'mixed'])
+def test_round_trip(tmp_path, staffs):
+    cache = PageResultCache(str(tmp_path), max_bytes=2 ** 20)
+    cache.put('page', staffs)
+
+    assert cache.get('page') == staffs
+
+
+def _page_staffs(n):
+    return [_staff(0, 10, 500, 90, [{'bbox': [i, i, 10, 10], 'class': f'class_{i}', 'confidence': 0.5}
+                                    for i in range(n)])]
+
+
+def test_eviction_keeps_size_bound(tmp_path):
+    cache = PageResultCache(str(tmp_path), max_bytes=2 ** 20)
+    for i in range(3):
+        cache.put(f'page_{i}', _page_staffs(50))
+        os.utime(tmp_path / f'page_{i}.npz', (i, i))
+    page_size = os.path.getsize(tmp_path / 'page_0.npz')
+
+    # Места хватает на две страницы: вытесняется давно не использованная
+    cache.max_bytes = 2 * page_size + page_size // 2
+    cache.get('page_0')
+    cache.put('page_3', _page_staffs(50))
+
+    assert sorted(os.listdir(tmp_path)) == ['page_0.npz', 'page_3.npz']
+    assert cache._size == sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+
+
+def test_temporary_files_not_counted_or_evicted(tmp_path):
+    # Оставленный прерванной записью временный файл
+    (tmp_path / 'page.npz.123.tmp').write_bytes(b'x' * 1000)
+    cache = PageResultCache(str(tmp_path), max_bytes=1)
+    assert cache._size == 0
+
+    cache.put('page', _page_staffs(1))
+    assert (tmp_path / 'page.npz.123.tmp').exists()
+    assert cache._size == 0
+
+
+@pytest.mark.parametrize('changed', ['version', 'model', 'settings'])
+def test_key_invalidated(tmp_path, monkeypatch, changed):
+    import pipeline.result_cache as result_cache
+
+    page = np.zeros((4, 4), dtype=np.uint8)
+    options = {'model_fingerprint': 'model', 'settings': 'morphology|None'}
+    key = PageResultCache(str(tmp_path), 2 ** 20, **options).key(page)
+
+    if changed == 'version':
+        monkeypatch.setattr(result_cache, 'PIPELINE_VERSION', result_cache.PIPELINE_VERSION + '.1')
+    elif changed == 'model':
+        options['model_fingerprint'] = 'other_model'
+    else:
+        options['settings'] = 'projection|None'
+
+    assert PageResultCache(str(tmp_path), 2 ** 20, **options).key(page) != key
@@ -0,0 +1,132 @@
+"""
+Сравнение способов поиска линий стана: морфологического и по проекциям.
+
+Для каждой страницы измеряется время поиска линий обоими способами и их
+согласованность: доля линий одного способа, для которых у другого есть линия
+не дальше tolerance пикселей по Y, и совпадение числа найденных станов.
+
+Сравнение имеет смысл только на целых страницах: без аргументов используются
+синтетические страницы A4 (300 и 600 DPI, станы с нотами и штилями, короткий
+последний стан); можно передать папку со сканами страниц или PDF-файл
+(растеризуется через pdf2image). Изображения меньше MIN_PAGE_HEIGHT пикселей
+по высоте (вырезанные символы, отдельные станы) пропускаются.
+
+Запуск:
+    cd staff_detector
+    python bench_line_engines.py [папка_со_страницами | файл.pdf]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import cv2
+from split_staffs import StaffDetector
+
+MIN_PAGE_HEIGHT = 1000
+SYNTHETIC_DPIS = (300, 600)
+
+
+def synthetic_page(dpi=300, staff_count=4, staff_widths=None, notes_per_staff=0, seed=0):
+    """
+    Синтетическая страница A4: станы из 5 линий с толщиной и интервалом печатных нот
+
+    Args:
+        dpi: разрешение (интервал 20 пикселей и толщина 2 пикселя при 300 DPI)
+        staff_count: число станов
+        staff_widths: доля ширины страницы, до которой доходит каждый стан (по умолчанию 0.9)
+        notes_per_staff: сколько нот со штилями нарисовать на каждом стане
+        seed: зерно для положения нот
+    """
+    k = dpi / 300
+    width, height = int(2480 * k), int(3508 * k)
+    page = np.full((height, width), 255, np.uint8)
+    spacing, thickness = int(20 * k), int(2 * k)
+    rng = np.random.default_rng(seed)
+    for staff in range(staff_count):
+        top = int((300 + staff * 600) * k)
+        left = int(150 * k)
+        right = int(width * (staff_widths[staff] if staff_widths else 0.9))
+        for line in range(5):
+            y = top + line * spacing
+            page[y:y + thickness, left:right] = 0
+        for _ in range(notes_per_staff):
+            x = int(rng.integers(left + spacing, right - spacing))
+            y = top + int(rng.integers(-2, 11)) * spacing // 2
+            cv2.ellipse(page, (x, y), (int(7 * k), int(5 * k)), -20, 0, 360, 0, -1)
+            cv2.line(page, (x + int(6 * k), y), (x + int(6 * k), y - int(60 * k)), 0, thickness)
+    return page
+
+
+def load_pages(source):
+    """Пары (название, grayscale страница) из папки, PDF или синтетические"""
+    if source is None:
+        for dpi in SYNTHETIC_DPIS:
+            yield f"synthetic_{dpi}dpi", synthetic_page(dpi, staff_count=5, notes_per_staff=30)
+            yield f"synthetic_{dpi}dpi_short", synthetic_page(dpi, staff_count=5, notes_per_staff=30,
+                                                              staff_widths=[0.9] * 4 + [0.2])
+    elif source.lower().endswith('.pdf'):
+        from pdf2image import convert_from_path
+        for i, page in enumerate(convert_from_path(source, dpi=300, grayscale=True)):
+            yield f"page_{i + 1}", np.asarray(page)
+    else:
+        for name in sorted(os.listdir(source)):
+            if name.lower().endswith(('.png', '.jpg', '.jpeg', '.tif', '.tiff')):
+                page = cv2.imread(os.path.join(source, name), cv2.IMREAD_GRAYSCALE)
+                if page is not None and page.shape[0] >= MIN_PAGE_HEIGHT:
+                    yield name, page
+                else:
+                    print(f"{name}: пропущено — не страница (высота меньше {MIN_PAGE_HEIGHT} пикселей)")
+
+
+def time_engine(detector, engine, repeats=3):
+    """Лучшее время поиска линий из repeats запусков и найденные линии"""
+    detector.line_engine = engine
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        detector.detect_lines()
+        best = min(best, time.perf_counter() - start)
+    lines = list(detector.horizontal_lines)
+    detector.group_lines_into_staffs()
+    return best, lines, len(detector.staffs)
+
+
+def matched_fraction(lines, reference, tolerance=2):
+    """Доля линий из lines, для которых в reference есть линия с близкой Y-координатой"""
+    if not lines:
+        return 1.0 if not reference else 0.0
+    ref_ys = [line[1] for line in reference]
+    matched = sum(1 for line in lines if any(abs(line[1] - y) <= tolerance for y in ref_ys))
+    return matched / len(lines)
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else None
+
+    print(f"{'страница':<24} {'морф., мс':>10} {'проекц., мс':>12} {'ускор.':>7} "
+          f"{'линии м/п':>10} {'согл.':>6} {'станы м/п':>10}")
+    total_morph = total_proj = 0.0
+    pages = 0
+    for name, page in load_pages(source):
+        detector = StaffDetector.from_array(page)
+        t_morph, morph_lines, morph_staffs = time_engine(detector, 'morphology')
+        t_proj, proj_lines, proj_staffs = time_engine(detector, 'projection')
+        total_morph += t_morph
+        total_proj += t_proj
+        pages += 1
+
+        agreement = min(matched_fraction(morph_lines, proj_lines), matched_fraction(proj_lines, morph_lines))
+        speedup = t_morph / t_proj if t_proj > 0 else float('inf')
+        print(f"{name:<24} {t_morph * 1000:>10.1f} {t_proj * 1000:>12.1f} {speedup:>6.1f}x "
+              f"{len(morph_lines):>4}/{len(proj_lines):<5} {agreement:>6.0%} {morph_staffs:>4}/{proj_staffs:<5}")
+
+    if pages and total_proj > 0:
+        print(f"\nИтого ({pages} стр.): морфология {total_morph:.2f} с, проекции {total_proj:.2f} с, "
+              f"ускорение {total_morph / total_proj:.1f}x")
+    elif not pages:
+        print("Нет страниц для сравнения")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,80 +3,270 @@ import numpy as np
 import os
 from typing import List, Tuple, Dict
 
+# Межлинейное расстояние (пиксели) на скане 300 DPI, под которое подобраны пороги по умолчанию;
+# при другом разрешении пороги масштабируются по оценке межлинейного расстояния страницы
+REFERENCE_LINE_SPACING = 20
+
+
+class StaffRegion:
+    """
+    Область стана без копирования пикселей: координаты и ссылка на общий
+    grayscale/бинарный буфер страницы. Цветная страница не удерживается.
+    Для передачи в другой процесс или долгого хранения используйте materialize().
+    """
+    __slots__ = ('id', 'left', 'top', 'right', 'bottom', 'line_count', 'avg_line_distance', 'page')
+
+    def __init__(self, id: int, left: int, top: int, right: int, bottom: int,
+                 line_count: int, avg_line_distance: float, page: np.ndarray):
+        self.id = id
+        self.left = left
+        self.top = top
+        self.right = right
+        self.bottom = bottom
+        self.line_count = line_count
+        self.avg_line_distance = avg_line_distance
+        self.page = page
+
+    @property
+    def image(self) -> np.ndarray:
+        """Представление области стана в буфере страницы (без копии)"""
+        return self.page[self.top:self.bottom, self.left:self.right]
+
+    @property
+    def coordinates(self) -> Dict:
+        """Координаты области в том же виде, что и в extract_staff_areas"""
+        return {
+            'left': self.left,
+            'top': self.top,
+            'right': self.right,
+            'bottom': self.bottom,
+            'width': self.right - self.left,
+            'height': self.bottom - self.top
+        }
+
+    def materialize(self) -> np.ndarray:
+        """Собственная копия изображения стана, не связанная с буфером страницы"""
+        return self.image.copy()
+
+    def __repr__(self):
+        return (f"StaffRegion(id={self.id}, left={self.left}, top={self.top}, "
+                f"right={self.right}, bottom={self.bottom}, line_count={self.line_count})")
+
 
 class StaffDetector:
-    def __init__(self, image_path: str):
+    LINE_ENGINES = ('morphology', 'projection')
+
+    def __init__(self, image_path: str = None, image: np.ndarray = None, is_binary: bool = False,
+                 line_engine: str = 'morphology', coarse_scale: float = None):
         """
         Инициализация детектора нотных станов
 
         Args:
             image_path: путь к изображению нотного листа
+            image: изображение нотного листа в памяти (вместо image_path),
+                grayscale или BGR
+            is_binary: image уже бинаризовано (чёрные символы на белом фоне, 0/255),
+                порог Otsu не считается
+            line_engine: способ поиска линий: 'morphology' (морфологическое открытие)
+                или 'projection' (горизонтальные проекции, быстрее на чистых нотах)
+            coarse_scale: если задан (например, 0.25), станы сначала ищутся на
+                уменьшенном изображении, а линии уточняются только в их полосах
         """
+        if image_path is None and image is None:
+            raise ValueError("Нужно указать image_path или image")
+        if line_engine not in self.LINE_ENGINES:
+            raise ValueError(f"Неизвестный способ поиска линий: {line_engine}")
 
-        self.contrasted = None
-        self.blur = None
         self.image_path = image_path
-        self.image = None
+        self.image = image
+        self.is_binary = is_binary
+        self.line_engine = line_engine
+        self.coarse_scale = coarse_scale
         self.gray = None
         self.binary = None
+        self.line_spacing = None
         self.horizontal_lines = []
         self.staffs = []
         self.staff_regions = []
         self.load_image()
 
+    @classmethod
+    def from_array(cls, image: np.ndarray, is_binary: bool = False,
+                   line_engine: str = 'morphology', coarse_scale: float = None) -> 'StaffDetector':
+        """
+        Создание детектора по изображению в памяти (например, растеризованной странице PDF)
+
+        Args:
+            image: grayscale или BGR изображение нотного листа
+            is_binary: image уже бинаризовано (чёрные символы на белом фоне, 0/255)
+            line_engine: способ поиска линий ('morphology' или 'projection')
+            coarse_scale: масштаб грубого поиска станов (None — поиск на полном разрешении)
+        """
+        return cls(image=image, is_binary=is_binary, line_engine=line_engine, coarse_scale=coarse_scale)
+
     def load_image(self):
         """Загрузка и предобработка изображения"""
-        self.image = cv2.imread(self.image_path)
         if self.image is None:
-            raise ValueError(f"Не удалось загрузить изображение: {self.image_path}")
+            # Одноканальные сканы читаются без копирования в три канала
+            self.image = cv2.imread(self.image_path, cv2.IMREAD_ANYCOLOR)
+            if self.image is None:
+                raise ValueError(f"Не удалось загрузить изображение: {self.image_path}")
 
-        self.contrasted = cv2.convertScaleAbs(self.image, alpha=1, beta=0)
+        # Преобразование в градации серого (для grayscale страниц — без копии)
+        if self.image.ndim == 2:
+            self.gray = self.image
+        else:
+            self.gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
 
-        self.blur = cv2.GaussianBlur(self.contrasted, (1, 1), 0)
+        # Бинаризация изображения
+        if self.is_binary:
+            self.binary = cv2.bitwise_not(self.gray)
+        else:
+            self.binary = cv2.threshold(
+                self.gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
+            )[1]
 
-        # Преобразование в градации серого
-        self.gray = cv2.cvtColor(self.blur, cv2.COLOR_BGR2GRAY)
+        self.line_spacing = estimate_line_spacing(self.binary)
 
-        # Бинаризация изображения
-        self.binary = cv2.threshold(
-            self.gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
-        )[1]
+    def _scaled(self, value: int) -> int:
+        """Порог, заданный для 300 DPI, в масштабе межлинейного расстояния этой страницы"""
+        if not self.line_spacing:
+            return value
+        return max(1, int(round(value * self.line_spacing / REFERENCE_LINE_SPACING)))
 
     def detect_horizontal_lines(self,
-                                min_line_length: int = 250,
-                                max_line_gap: int = 10):
+                                min_line_length: int = None,
+                                max_line_gap: int = None):
         """
         Обнаружение горизонтальных линий на изображении
 
         Args:
             min_line_length: минимальная длина линии для детекции
+                (по умолчанию 250 пикселей при 300 DPI, см. REFERENCE_LINE_SPACING)
             max_line_gap: максимальный разрыв в линии
         """
-        # Морфологическое открытие для выделения горизонтальных линий
-        horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (50, 1))
-        opened = cv2.morphologyEx(self.binary, cv2.MORPH_OPEN, horizontal_kernel, iterations=2)
+        if min_line_length is None:
+            min_line_length = self._scaled(250)
+        self.horizontal_lines = _morphology_lines(self.binary, min_line_length)
+
+    def detect_horizontal_lines_projection(self,
+                                           min_line_length: int = None,
+                                           max_line_gap: int = None,
+                                           downscale: int = 4,
+                                           peak_ratio: float = 0.5):
+        """
+        Обнаружение горизонтальных линий по горизонтальной проекции бинарного изображения
+
+        Строки, в которых чернил не меньше min_line_length, объединяются в серии;
+        серия делится на отдельные линии там, где проекция опускается ниже peak_ratio
+        от максимума этой серии (соседние линии, слипшиеся через штили и вязки).
+        Порог не зависит от самой длинной линии страницы, поэтому короткие станы
+        (например, кода) не теряются. Результат в том же формате (x1, y, x2, y),
+        что и у detect_horizontal_lines.
+
+        Args:
+            min_line_length: минимальная длина линии для детекции
+                (по умолчанию 250 пикселей при 300 DPI, см. REFERENCE_LINE_SPACING)
+            max_line_gap: максимальный разрыв в линии по горизонтали (по умолчанию 10 при 300 DPI)
+            downscale: во сколько раз сжимать изображение по ширине для подсчёта проекции
+                (по высоте разрешение не меняется, чтобы не сливать соседние линии)
+            peak_ratio: доля от максимума серии, ниже которой серия делится на линии
+        """
+        if min_line_length is None:
+            min_line_length = self._scaled(250)
+        if max_line_gap is None:
+            max_line_gap = self._scaled(10)
+        self.horizontal_lines = _projection_lines(
+            self.binary, min_line_length, max_line_gap, downscale, peak_ratio
+        )
+
+    def detect_lines_coarse_to_fine(self,
+                                    scale: float = None,
+                                    min_line_length: int = None,
+                                    band_gap: int = None,
+                                    coarse_ratio: float = 0.25):
+        """
+        Поиск линий «от грубого к точному» для сканов высокого разрешения
+
+        Кандидаты в станы ищутся по проекции уменьшенного в 1/scale раз бинарного
+        изображения; на полном разрешении линии уточняются только в полосах вокруг
+        кандидатов выбранным способом (line_engine). Остальная часть страницы
+        на полном разрешении не обрабатывается.
 
-        # Нахождение контуров
-        contours = cv2.findContours(opened, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        contours = contours[0] if len(contours) == 2 else contours[1]
+        Args:
+            scale: масштаб грубого изображения (по умолчанию coarse_scale детектора)
+            min_line_length: минимальная длина линии для детекции (на полном разрешении;
+                по умолчанию 250 пикселей при 300 DPI, см. REFERENCE_LINE_SPACING)
+            band_gap: кандидаты ближе этого расстояния (на полном разрешении)
+                объединяются в одну полосу (по умолчанию 60 пикселей при 300 DPI)
+            coarse_ratio: допуск на размытие: строка считается кандидатом, если чернил
+                в ней не меньше coarse_ratio от линии длиной min_line_length на грубом
+                изображении (при уменьшении линия тоньше 1/scale пикселя бледнеет
+                и делится между соседними строками). Порог не зависит от самой длинной
+                линии страницы, поэтому короткие станы не теряются
+        """
+        scale = scale or self.coarse_scale or 0.25
+        if min_line_length is None:
+            min_line_length = self._scaled(250)
+        if band_gap is None:
+            band_gap = self._scaled(60)
+        height, width = self.binary.shape
+        small = cv2.resize(
+            self.binary,
+            (max(1, int(width * scale)), max(1, int(height * scale))),
+            interpolation=cv2.INTER_AREA
+        )
 
-        # Фильтрация и преобразование контуров в линии
         self.horizontal_lines = []
-        for cnt in contours:
-            x, y, w, h = cv2.boundingRect(cnt)
-            if w > min_line_length:  # Фильтр по длине линии
-                self.horizontal_lines.append((x, y, x + w - 1, y))
+        profile = small.sum(axis=1, dtype=np.int64)
+        if profile.size == 0 or profile.max() == 0:
+            return
+
+        starts, ends = _find_runs(profile >= coarse_ratio * min_line_length * scale * 255)
+
+        # Переводим кандидатов в полосы полного разрешения и объединяем близкие
+        margin = int(np.ceil(1 / scale)) + 2
+        bands = []
+        for start, end in zip(starts, ends):
+            y1 = max(0, int(start / scale) - margin)
+            y2 = min(height, int(np.ceil(end / scale)) + margin)
+            if bands and y1 - bands[-1][1] <= band_gap:
+                bands[-1][1] = max(bands[-1][1], y2)
+            else:
+                bands.append([y1, y2])
+
+        # Уточнение линий на полном разрешении только внутри полос
+        for y1, y2 in bands:
+            band = self.binary[y1:y2]
+            if self.line_engine == 'projection':
+                lines = _projection_lines(band, min_line_length, self._scaled(10))
+            else:
+                lines = _morphology_lines(band, min_line_length)
+            self.horizontal_lines.extend((x1, y + y1, x2, y + y1) for x1, y, x2, _ in lines)
+
+    def detect_lines(self, **kwargs):
+        """Обнаружение горизонтальных линий выбранным способом (line_engine, coarse_scale)"""
+        if self.coarse_scale:
+            self.detect_lines_coarse_to_fine(**kwargs)
+        elif self.line_engine == 'projection':
+            self.detect_horizontal_lines_projection(**kwargs)
+        else:
+            self.detect_horizontal_lines(**kwargs)
 
     def group_lines_into_staffs(self,
-                                max_line_gap: int = 30,
+                                max_line_gap: int = None,
                                 min_lines_in_staff: int = 4):
         """
         Группировка линий в нотные станы
 
         Args:
             max_line_gap: максимальное расстояние между линиями в одном стане
+                (по умолчанию 30 пикселей при 300 DPI, см. REFERENCE_LINE_SPACING)
             min_lines_in_staff: минимальное количество линий для образования стана
         """
+        if max_line_gap is None:
+            max_line_gap = self._scaled(30)
+
         # Сортируем линии по Y-координате
         sorted_lines = sorted(self.horizontal_lines, key=lambda x: x[1])
 
@@ -137,6 +327,14 @@ class StaffDetector:
             'height': bottom - top
         }
 
+    def _staff_bounds(self, staff: Dict) -> Tuple[int, int]:
+        """Верхняя и нижняя границы области стана с отступами"""
+        # Добавляем отступы сверху и снизу
+        padding = int(staff['avg_line_distance'] * 1.5)
+        y1 = max(0, staff['top'] - padding)
+        y2 = min(self.image.shape[0] - 1, staff['bottom'] + padding)
+        return y1, y2
+
     def extract_staff_areas(self, output_dir: str = None) -> List[Dict]:
         """
         Извлечение областей станов из изображения
@@ -150,10 +348,7 @@ class StaffDetector:
         self.staff_regions = []
 
         for i, staff in enumerate(self.staffs):
-            # Добавляем отступы сверху и снизу
-            padding = int(staff['avg_line_distance'] * 1.5)
-            y1 = max(0, staff['top'] - padding)
-            y2 = min(self.image.shape[0] - 1, staff['bottom'] + padding)
+            y1, y2 = self._staff_bounds(staff)
 
             # Вырезаем область стана
             staff_region = self.image[y1:y2, staff['left']:staff['right']]
@@ -185,6 +380,40 @@ class StaffDetector:
 
         return self.staff_regions
 
+    def extract_staff_views(self, source: str = 'gray', output_dir: str = None) -> List[StaffRegion]:
+        """
+        Извлечение областей станов как представлений общего буфера страницы (без копий)
+
+        Args:
+            source: буфер страницы: 'gray' (градации серого) или 'binary'
+                (бинарное изображение, символы = 255)
+            output_dir: директория для сохранения (опционально)
+
+        Returns:
+            Список StaffRegion
+        """
+        if source == 'gray':
+            page = self.gray
+        elif source == 'binary':
+            page = self.binary
+        else:
+            raise ValueError(f"Неизвестный буфер страницы: {source}")
+
+        regions = []
+        for i, staff in enumerate(self.staffs):
+            y1, y2 = self._staff_bounds(staff)
+            region = StaffRegion(i, staff['left'], y1, staff['right'], y2,
+                                 staff['line_count'], staff['avg_line_distance'], page)
+
+            # Сохраняем в файл если указана директория
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+                cv2.imwrite(os.path.join(output_dir, f'staff_{i}.png'), region.image)
+
+            regions.append(region)
+
+        return regions
+
     def visualize(self,
                   output_path: str = None,
                   line_color: Tuple[int, int, int] = (0, 0, 255),
@@ -200,8 +429,11 @@ class StaffDetector:
         Returns:
             Изображение с визуализацией
         """
-        # Создаем копию изображения для рисования
-        vis_img = self.image.copy()
+        # Создаем цветную копию изображения для рисования
+        if self.image.ndim == 2:
+            vis_img = cv2.cvtColor(self.image, cv2.COLOR_GRAY2BGR)
+        else:
+            vis_img = self.image.copy()
 
         # Рисуем линии
         for line in self.horizontal_lines:
@@ -252,7 +484,7 @@ class StaffDetector:
         Args:
             output_dir: директория для сохранения результатов (опционально)
         """
-        self.detect_horizontal_lines()
+        self.detect_lines()
         self.group_lines_into_staffs()
         self.extract_staff_areas(output_dir)
         self.print_coordinates()
@@ -260,6 +492,145 @@ class StaffDetector:
         return self.staff_regions
 
 
+def _morphology_lines(binary: np.ndarray, min_line_length: int) -> List[Tuple[int, int, int, int]]:
+    """Поиск горизонтальных линий морфологическим открытием и контурами"""
+    # Морфологическое открытие для выделения горизонтальных линий
+    horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (50, 1))
+    opened = cv2.morphologyEx(binary, cv2.MORPH_OPEN, horizontal_kernel, iterations=2)
+
+    # Нахождение контуров
+    contours = cv2.findContours(opened, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = contours[0] if len(contours) == 2 else contours[1]
+
+    # Фильтрация и преобразование контуров в линии
+    lines = []
+    for cnt in contours:
+        x, y, w, h = cv2.boundingRect(cnt)
+        if w > min_line_length:  # Фильтр по длине линии
+            lines.append((x, y, x + w - 1, y))
+    return lines
+
+
+def _projection_lines(binary: np.ndarray,
+                      min_line_length: int,
+                      max_line_gap: int = 10,
+                      downscale: int = 4,
+                      peak_ratio: float = 0.5) -> List[Tuple[int, int, int, int]]:
+    """Поиск горизонтальных линий по горизонтальной проекции (см. detect_horizontal_lines_projection)"""
+    profile_source = binary
+    if downscale > 1:
+        small_width = max(1, binary.shape[1] // downscale)
+        profile_source = cv2.resize(binary, (small_width, binary.shape[0]), interpolation=cv2.INTER_AREA)
+        scale = binary.shape[1] / small_width
+    else:
+        scale = 1.0
+
+    # Количество чернильных пикселей в каждой строке (в пикселях исходной ширины)
+    profile = profile_source.sum(axis=1, dtype=np.int64) * (scale / 255.0)
+    if profile.size == 0 or profile.max() == 0:
+        return []
+
+    # Порог строки — по длине линии, а не по максимуму страницы; peak_ratio только
+    # разделяет соседние пики внутри одной серии строк
+    runs = []
+    for start, end in zip(*_find_runs(profile >= min_line_length)):
+        run = profile[start:end]
+        peak_starts, peak_ends = _find_runs(run >= peak_ratio * run.max())
+        runs.extend(zip(peak_starts + start, peak_ends + start))
+
+    lines = []
+    for y1, y2 in runs:
+        # Горизонтальные границы линии ищем только в её полосе на полном разрешении
+        columns = binary[y1:y2].any(axis=0)
+        col_starts, col_ends = _find_runs(columns)
+        if len(col_starts) == 0:
+            continue
+
+        # Склеиваем отрезки с разрывами не больше max_line_gap и берём самый длинный
+        best_start, best_end = col_starts[0], col_ends[0]
+        cur_start, cur_end = best_start, best_end
+        for x1, x2 in zip(col_starts[1:], col_ends[1:]):
+            if x1 - cur_end <= max_line_gap:
+                cur_end = x2
+            else:
+                cur_start, cur_end = x1, x2
+            if cur_end - cur_start > best_end - best_start:
+                best_start, best_end = cur_start, cur_end
+
+        if best_end - best_start > min_line_length:
+            lines.append((int(best_start), int(y1), int(best_end) - 1, int(y1)))
+    return lines
+
+
+def estimate_line_spacing(binary: np.ndarray, columns: int = 64) -> float:
+    """
+    Оценка межлинейного расстояния стана по вертикальным сериям пикселей
+
+    В выборке столбцов самая частая длина чёрной серии — толщина нотной линии,
+    самая частая длина белой — промежуток между линиями; их сумма — расстояние
+    между соседними линиями стана.
+
+    Args:
+        binary: бинарное изображение (символы и линии = 255)
+        columns: сколько столбцов просматривать
+
+    Returns:
+        Расстояние в пикселях или None, если на странице нет чернил
+    """
+    height, width = binary.shape
+    # Столбцы подряд в одном одномерном массиве; пустая строка между ними разделяет серии
+    sample = binary[:, ::max(1, width // columns)].T > 0
+    ink = np.pad(sample, ((0, 0), (0, 1))).ravel()
+    ink_starts, ink_ends = _find_runs(ink)
+    if len(ink_starts) == 0:
+        return None
+    # Белые серии между чёрными сериями одного столбца (у краёв столбца — не промежутки)
+    inside = ink_starts[1:] // (height + 1) == ink_ends[:-1] // (height + 1)
+    gaps = (ink_starts[1:] - ink_ends[:-1])[inside]
+    if len(gaps) == 0:
+        return None
+    thickness = np.bincount(ink_ends - ink_starts).argmax()
+    return float(thickness + np.bincount(gaps).argmax())
+
+
+def _find_runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Поиск серий подряд идущих True в одномерной маске
+
+    Returns:
+        Массивы начал и концов (конец не включается) серий
+    """
+    padded = np.concatenate(([0], mask.astype(np.int8), [0]))
+    edges = np.diff(padded)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def extract_staff_regions(image_path: str = None, output_dir: str = None,
+                          image: np.ndarray = None, line_engine: str = 'morphology',
+                          coarse_scale: float = None, as_views: bool = False) -> List:
+    """
+    Извлечение нотных станов из изображения нотного листа
+
+    Args:
+        image_path: путь к изображению нотного листа
+        output_dir: директория для сохранения станов (опционально)
+        image: изображение нотного листа в памяти (вместо image_path)
+        line_engine: способ поиска линий ('morphology' или 'projection')
+        coarse_scale: масштаб грубого поиска станов (None — поиск на полном разрешении)
+        as_views: вернуть StaffRegion (представления grayscale буфера страницы)
+            вместо словарей с вырезанными изображениями
+
+    Returns:
+        Список словарей с информацией о вырезанных станах или список StaffRegion
+    """
+    detector = StaffDetector(image_path, image=image, line_engine=line_engine, coarse_scale=coarse_scale)
+    detector.detect_lines()
+    detector.group_lines_into_staffs()
+    if as_views:
+        return detector.extract_staff_views(output_dir=output_dir)
+    return detector.extract_staff_areas(output_dir)
+
+
 if __name__ == '__main__':
     # Пример использования класса
     detector = StaffDetector("test.png")
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from staff_detector.split_staffs import StaffDetector
+
+
+def _page(dpi, staff_count=4, staff_widths=None):
+    """Синтетическая страница A4: станы из 5 линий с толщиной и интервалом печатных нот"""
+    k = dpi / 300
+    width, height = int(2480 * k), int(3508 * k)
+    page = np.full((height, width), 255, np.uint8)
+    spacing, thickness = int(20 * k), int(2 * k)
+    for staff in range(staff_count):
+        top = int((300 + staff * 600) * k)
+        right = int(width * (staff_widths[staff] if staff_widths else 0.9))
+        for line in range(5):
+            y = top + line * spacing
+            page[y:y + thickness, int(150 * k):right] = 0
+    return page
+
+
+@pytest.mark.parametrize('line_engine', ['morphology', 'projection'])
+@pytest.mark.parametrize('coarse_scale', [None, 0.25])
+@pytest.mark.parametrize('dpi', [300, 600])
+def test_staffs_found_at_any_dpi(dpi, line_engine, coarse_scale):
+    detector = StaffDetector.from_array(_page(dpi), line_engine=line_engine, coarse_scale=coarse_scale)
+    detector.detect_lines()
+    detector.group_lines_into_staffs()
+
+    assert detector.line_spacing == pytest.approx(20 * dpi / 300, abs=1)
+    assert [staff['line_count'] for staff in detector.staffs] == [5] * 4
+
+
+@pytest.mark.parametrize('line_engine, coarse_scale', [
+    ('projection', None),
+    ('projection', 0.25),
+    ('morphology', 0.25),
+])
+@pytest.mark.parametrize('dpi', [300, 600])
+def test_short_staff_not_dropped(dpi, line_engine, coarse_scale):
+    # Последний стан (например, кода) занимает пятую часть ширины страницы
+    page = _page(dpi, staff_widths=[0.9, 0.9, 0.9, 0.2])
+    detector = StaffDetector.from_array(page, line_engine=line_engine, coarse_scale=coarse_scale)
+    detector.detect_lines()
+    detector.group_lines_into_staffs()
+
+    assert [staff['line_count'] for staff in detector.staffs] == [5] * 4
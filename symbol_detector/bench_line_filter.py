@@ -0,0 +1,72 @@
+"""
+Бенчмарк фильтрации компонент линий в remove_staff_lines.
+
+Сравнивает прежний цикл по меткам (filtered_mask[labels == i] = 255)
+с табличной версией filter_line_components на синтетических станах
+с большим количеством фрагментов линий.
+
+Запуск:
+    cd symbol_detector
+    python bench_line_filter.py
+"""
+
+import time
+import cv2 as cv
+import numpy as np
+from extract_symbols import filter_line_components
+
+
+def filter_line_components_loop(line_mask, min_line_length):
+    """Прежняя реализация: проход по всему изображению на каждую компоненту"""
+    num_labels, labels, stats, _ = cv.connectedComponentsWithStats(line_mask, connectivity=8)
+    filtered_mask = np.zeros_like(line_mask)
+    for i in range(1, num_labels):
+        x, y, w_box, h_box, area = stats[i]
+        if w_box > min_line_length or h_box > min_line_length:
+            filtered_mask[labels == i] = 255
+    return filtered_mask
+
+
+def make_synthetic_staff(width, height, fragments_per_line, seed=0):
+    """Стан из 5 линий, разорванных на фрагменты, плюс короткие вертикальные штрихи"""
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((height, width), np.uint8)
+    spacing = height // 8
+    step = width / fragments_per_line
+    for line in range(5):
+        y = spacing * (line + 2)
+        for j in range(fragments_per_line):
+            x1 = int(j * step)
+            x2 = int(x1 + step * rng.uniform(0.3, 0.9))
+            mask[y:y + 2, x1:x2] = 255
+    for _ in range(fragments_per_line):
+        x = int(rng.integers(0, width - 2))
+        y = int(rng.integers(0, height - spacing * 3))
+        mask[y:y + int(rng.integers(5, spacing * 3)), x:x + 2] = 255
+    return mask
+
+
+def bench(func, mask, min_line_length, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(mask, min_line_length)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    min_line_length = 20
+    print(f"{'фрагментов':>11} {'компонент':>10} {'цикл, мс':>10} {'таблица, мс':>12} {'ускорение':>10}")
+    for fragments in (50, 200, 1000, 3000):
+        mask = make_synthetic_staff(width=6000, height=240, fragments_per_line=fragments)
+        num_labels = cv.connectedComponents(mask, connectivity=8)[0] - 1
+        repeats = 3 if fragments <= 1000 else 1
+        t_loop, ref = bench(filter_line_components_loop, mask, min_line_length, repeats)
+        t_lut, res = bench(filter_line_components, mask, min_line_length, repeats)
+        assert np.array_equal(ref, res), "Результаты реализаций не совпадают"
+        print(f"{fragments:>11} {num_labels:>10} {t_loop * 1000:>10.1f} {t_lut * 1000:>12.1f} {t_loop / t_lut:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,12 +15,25 @@ def estimate_line_thickness(binary_img):
     thickness = int(np.median(thicknesses)) if thicknesses else 2
     return max(1, min(thickness, 4))
 
-def remove_staff_lines(staff_image):
-    input_path = staff_image.replace('\\', '/')
-    im = cv.imread(input_path)
-    assert im is not None, f"Файл {input_path} не удалось прочитать"
-    gray = cv.cvtColor(im, cv.COLOR_BGR2GRAY)
-
+def _to_gray(image):
+    if image.ndim == 3:
+        return cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    return image
+
+def filter_line_components(line_mask, min_line_length):
+    """
+    Оставляет в маске только компоненты, длиннее min_line_length по ширине или высоте.
+    Решение принимается один раз на компоненту по stats, а маска строится
+    одной индексацией таблицы keep по labels — без прохода по изображению на каждую метку.
+    """
+    _, labels, stats, _ = cv.connectedComponentsWithStats(line_mask, connectivity=8)
+    keep = (stats[:, cv.CC_STAT_WIDTH] > min_line_length) | (stats[:, cv.CC_STAT_HEIGHT] > min_line_length)
+    keep[0] = False  # фон
+    lut = np.where(keep, 255, 0).astype(np.uint8)
+    return lut[labels]
+
+def _clean_staff(gray):
+    """Удаляет линии стана; возвращает бинарную маску символов (символы = 255) и толщину линий"""
     _, binary = cv.threshold(gray, 0, 255, cv.THRESH_BINARY_INV + cv.THRESH_OTSU)
     h, w = binary.shape
 
@@ -36,13 +49,8 @@ def remove_staff_lines(staff_image):
     vertical_lines = cv.morphologyEx(binary, cv.MORPH_OPEN, vertical_kernel, iterations=1)
     line_mask = cv.bitwise_or(horizontal_lines, vertical_lines)
 
-    num_labels, labels, stats, _ = cv.connectedComponentsWithStats(line_mask, connectivity=8)
-    filtered_mask = np.zeros_like(line_mask)
     min_line_length = max(20, horiz_length // 4)
-    for i in range(1, num_labels):
-        x, y, w_box, h_box, area = stats[i]
-        if w_box > min_line_length or h_box > min_line_length:
-            filtered_mask[labels == i] = 255
+    filtered_mask = filter_line_components(line_mask, min_line_length)
 
     inpainted = cv.inpaint(gray, filtered_mask, inpaintRadius=7, flags=cv.INPAINT_TELEA)
     _, binary2 = cv.threshold(inpainted, 0, 255, cv.THRESH_BINARY_INV + cv.THRESH_OTSU)
@@ -55,6 +63,15 @@ def remove_staff_lines(staff_image):
     cleaned = cv.morphologyEx(cleaned, cv.MORPH_OPEN, noise_kernel)
     kernel = np.ones((2, 2), np.uint8)
     cleaned = cv.erode(cleaned, kernel, iterations=1)
+    return cleaned, line_thickness
+
+def remove_staff_lines(staff_image):
+    input_path = staff_image.replace('\\', '/')
+    im = cv.imread(input_path)
+    assert im is not None, f"Файл {input_path} не удалось прочитать"
+    gray = cv.cvtColor(im, cv.COLOR_BGR2GRAY)
+
+    cleaned, line_thickness = _clean_staff(gray)
 
     result = cv.bitwise_not(cleaned)
     output_path = os.path.join(os.path.dirname(input_path), "cleaned_auto.jpg")
@@ -62,6 +79,56 @@ def remove_staff_lines(staff_image):
     print(f"Результат сохранён: {output_path} (толщина линий: {line_thickness})")
     return output_path
 
+def clean_staff_image(staff_image, min_area=50, max_area=5000, debug_dir=None):
+    """
+    Удаление линий стана для изображения в памяти (без временных файлов)
+
+    Args:
+        staff_image: изображение стана (grayscale или BGR), например staff['image']
+        min_area: минимальная площадь символа
+        max_area: максимальная площадь символа
+        debug_dir: если задан, туда сохраняется очищенное изображение для отладки
+
+    Returns:
+        Кортеж (бинарная маска символов, где символы = 255; список bbox (x, y, w, h))
+    """
+    gray = _to_gray(staff_image)
+    cleaned, line_thickness = _clean_staff(gray)
+    symbol_boxes = find_symbol_contours(cleaned, min_area, max_area)
+
+    if debug_dir:
+        os.makedirs(debug_dir, exist_ok=True)
+        cv.imwrite(os.path.join(debug_dir, "cleaned_auto.png"), cv.bitwise_not(cleaned))
+
+    return cleaned, symbol_boxes
+
+def extract_symbols_from_staff(staff_image, target_size=(64, 64), debug_dir=None):
+    """
+    Извлечение символов из изображения стана в памяти
+
+    Args:
+        staff_image: изображение стана (grayscale или BGR)
+        target_size: размер, к которому приводится каждый символ
+        debug_dir: директория для отладочных файлов (опционально)
+
+    Returns:
+        Список кортежей (изображение символа uint8, bbox [x, y, w, h]);
+        символ чёрный на белом фоне, как в extract_symbols
+    """
+    cleaned, symbol_boxes = clean_staff_image(staff_image, debug_dir=debug_dir)
+    symbols_view = cv.bitwise_not(cleaned)
+
+    output = []
+    for x, y, w, h in symbol_boxes:
+        resized = cv.resize(symbols_view[y:y+h, x:x+w], target_size)
+        output.append((resized, [x, y, w, h]))
+
+    if debug_dir:
+        for idx, (resized, _) in enumerate(output):
+            cv.imwrite(os.path.join(debug_dir, f"symbol_{idx}.png"), resized)
+
+    return output
+
 def find_symbol_contours(cleaned_image, min_area=50, max_area=5000):
     contours, _ = cv.findContours(cleaned_image, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
     symbol_boxes = []
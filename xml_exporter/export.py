@@ -1,104 +1,522 @@
-from music21 import *
+import io
 import os
+import copy
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import groupby
+from xml.sax.saxutils import escape, quoteattr
 
-def MusicXML_Exporter(Data_note):
+# music21 импортируется только в бэкенде 'music21': сам импорт занимает секунды
 
-    """Сортировка нот по X координате"""
-    Sort_data_note=sorted(Data_note, key=lambda x: x[1][0], reverse=False)
+DEFAULT_TITLE = "NO TITLE"
+DEFAULT_COMPOSER = "NO COMPOSER"
 
-    s = stream.Stream()
+DIVISIONS = 4  # длительностей на четверть: шестнадцатая = 1
+DEFAULT_TIME = (4, 4)
+
+DEFAULT_COMPRESS_LEVEL = 6  # zlib 1-9 для .mxl
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+DOCTYPE = ('<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 4.0 Partwise//EN" '
+           '"http://www.musicxml.org/dtds/partwise.dtd">\n')
+
+# Длительность в долях DIVISIONS и тип ноты MusicXML
+DURATIONS = {
+    'whole': (16, 'whole'),
+    'half': (8, 'half'),
+    'quarter': (4, 'quarter'),
+    'eighth': (2, 'eighth'),
+    'sixteenth': (1, '16th'),
+}
+
+# Ключ: (знак, линия, смещение октавы)
+CLEFS = {
+    'clef_g': ('G', 2, 0),
+    'clef_g8': ('G', 2, -1),
+    'clef_f': ('F', 4, 0),
+    'clef_c': ('C', 3, 0),
+}
+
+ACCIDENTALS = {
+    'sharp': 1,
+    'flat': -1,
+    'natural': 0,
+    'double_sharp': 2,
+}
+ACCIDENTAL_NAMES = {1: 'sharp', -1: 'flat', 0: 'natural', 2: 'double-sharp'}
+
+
+@lru_cache(maxsize=None)
+def parse_symbol(symbol_class):
+    """
+    Разбор имени класса символа
+
+    Поддерживаются классы классификатора (note_head_quarter, pause_eighth, clef_g,
+    time_3_4) и подробные имена вида note_quarter_A_sharp / rest_half.
+
+    Возвращает:
+        ('clef', знак, линия, смещение октавы), ('time', доли, длительность доли),
+        ('note', длительность, нота, альтерация), ('rest', длительность)
+        или None для символов, которые не попадают в MusicXML
+    """
+    if symbol_class in CLEFS:
+        return ('clef',) + CLEFS[symbol_class]
+
+    parts = symbol_class.split('_')
+    if parts[0] == 'time':
+        if parts[1:] == ['common']:
+            return ('time',) + DEFAULT_TIME
+        if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+            return ('time', int(parts[1]), int(parts[2]))
+        return None
+
+    if parts[0] == 'note':
+        if len(parts) > 1 and parts[1] == 'head':
+            parts = parts[:1] + parts[2:]
+        if len(parts) < 2 or parts[1] not in DURATIONS:
+            return None
+        step = parts[2].upper() if len(parts) > 2 else 'C'
+        alter = ACCIDENTALS.get('_'.join(parts[3:])) if len(parts) > 3 else None
+        return ('note', parts[1], step, alter)
+
+    if parts[0] in ('rest', 'pause'):
+        if len(parts) > 1 and parts[1] in DURATIONS:
+            return ('rest', parts[1])
+    return None
+
+
+def _symbol_fields(symbol):
+    """(страница, стан, x, класс) из словаря результата распознавания или кортежа (класс, (x, y, w, h))"""
+    if isinstance(symbol, dict):
+        return symbol.get('page', 0), symbol.get('staff', 0), symbol['bbox'][0], symbol['class']
+    return 0, 0, symbol[1][0], symbol[0]
+
+
+def sort_symbols(results):
+    """Символы в порядке чтения: страница, стан, затем слева направо"""
+    return sorted((_symbol_fields(symbol) for symbol in results), key=lambda s: s[:3])
+
+
+class MeasureBuilder:
+    """
+    Построение тактов MusicXML из потока символов в порядке чтения
+
+    Хранит текущие ключ и размер; такт закрывается, когда сумма длительностей
+    достигает размера, перед нотой, которая в него не помещается, и в конце стана. Такты возвращаются по мере заполнения, поэтому в памяти
+    находится только незаполненный такт.
+    """
+
+    def __init__(self, divisions=DIVISIONS):
+        self.divisions = divisions
+        self.clef = None
+        self.time = None
+        self.number = 0
+        self._measure = None
+        self._filled = 0
+        self._clef_pending = False
+        self._time_pending = False
+        self._new_system = False
+
+    @property
+    def capacity(self):
+        beats, beat_type = self.time or DEFAULT_TIME
+        return beats * self.divisions * 4 // beat_type
+
+    def start_system(self):
+        """
+        Начало нового стана: незаполненный такт закрывается,
+        следующий такт начнется с новой строки
+
+        Возвращает:
+            Список закрытых тактов (ET.Element)
+        """
+        self._new_system = True
+        return [self._close()] if self._measure is not None else []
+
+    def add(self, symbol):
+        """
+        Добавление разобранного символа (результат parse_symbol)
+
+        Возвращает:
+            Список закрытых тактов (ET.Element)
+        """
+        kind = symbol[0]
+        completed = []
+        if kind == 'clef':
+            if symbol[1:] != self.clef:
+                self.clef = symbol[1:]
+                if self._measure is not None:
+                    self._append_clef(ET.SubElement(self._measure, 'attributes'))
+                else:
+                    self._clef_pending = True
+        elif kind == 'time':
+            if symbol[1:] != self.time:
+                self.time = symbol[1:]
+                # Новый размер начинается с нового такта
+                if self._measure is not None:
+                    completed.append(self._close())
+                self._time_pending = True
+        else:
+            # Нота, не помещающаяся в такт, начинает следующий
+            if self._measure is not None and self._filled + self._duration(symbol) > self.capacity:
+                completed.append(self._close())
+            if self._measure is None:
+                self._open()
+            self._append_note(symbol)
+            if self._filled >= self.capacity:
+                completed.append(self._close())
+        return completed
+
+    def finish(self):
+        """Закрытие незаполненного такта; для пустой партии — пустой первый такт"""
+        if self._measure is None and self.number == 0:
+            self._open()
+        return [self._close()] if self._measure is not None else []
+
+    def _open(self):
+        self.number += 1
+        measure = ET.Element('measure', number=str(self.number))
+        if self._new_system and self.number > 1:
+            ET.SubElement(measure, 'print', {'new-system': 'yes'})
+        self._new_system = False
+
+        first = self.number == 1
+        if first or self._clef_pending or self._time_pending:
+            attributes = ET.SubElement(measure, 'attributes')
+            if first:
+                ET.SubElement(attributes, 'divisions').text = str(self.divisions)
+                key = ET.SubElement(attributes, 'key')
+                ET.SubElement(key, 'fifths').text = '0'
+            if first or self._time_pending:
+                beats, beat_type = self.time or DEFAULT_TIME
+                time = ET.SubElement(attributes, 'time')
+                ET.SubElement(time, 'beats').text = str(beats)
+                ET.SubElement(time, 'beat-type').text = str(beat_type)
+            if (first and self.clef is not None) or self._clef_pending:
+                self._append_clef(attributes)
+        self._clef_pending = self._time_pending = False
+        self._measure = measure
+        self._filled = 0
+
+    def _close(self):
+        measure = self._measure
+        self._measure = None
+        return measure
+
+    def _append_clef(self, attributes):
+        sign, line, octave_change = self.clef
+        clef = ET.SubElement(attributes, 'clef')
+        ET.SubElement(clef, 'sign').text = sign
+        ET.SubElement(clef, 'line').text = str(line)
+        if octave_change:
+            ET.SubElement(clef, 'clef-octave-change').text = str(octave_change)
+
+    def _duration(self, symbol):
+        return DURATIONS[symbol[1]][0] * self.divisions // DIVISIONS or 1
+
+    def _append_note(self, symbol):
+        duration = self._duration(symbol)
+        note_type = DURATIONS[symbol[1]][1]
+        note = ET.SubElement(self._measure, 'note')
+        if symbol[0] == 'rest':
+            ET.SubElement(note, 'rest')
+        else:
+            _, _, step, alter = symbol
+            pitch = ET.SubElement(note, 'pitch')
+            ET.SubElement(pitch, 'step').text = step
+            if alter:
+                ET.SubElement(pitch, 'alter').text = str(alter)
+            ET.SubElement(pitch, 'octave').text = '4'
+        ET.SubElement(note, 'duration').text = str(duration)
+        ET.SubElement(note, 'type').text = note_type
+        if symbol[0] == 'note' and symbol[3] is not None:
+            ET.SubElement(note, 'accidental').text = ACCIDENTAL_NAMES[symbol[3]]
+        self._filled += duration
 
-    """Добавление методанных"""
-    s.insert(0, metadata.Metadata())
-    s.metadata.title = "NO TITLE"
-    s.metadata.composer = "NO COMPOSER"
 
-    """Добавляем ключ"""
-    dict_key={"clef_g":clef.TrebleClef(),"clef_f":clef.BassClef(),"clef_c":clef.AltoClef()}
-    clif=0
-    for simbol in Sort_data_note:
-        if simbol[0] in dict_key:
-            clif=dict_key[simbol[0]]
-            Sort_data_note.remove(simbol)
-    s.append(clif)
+def score_header(title=DEFAULT_TITLE, composer=DEFAULT_COMPOSER):
+    """Начало документа score-partwise до открытого <part id="P1">"""
+    return (
+        XML_DECLARATION + DOCTYPE
+        + '<score-partwise version="4.0">\n'
+        + f'  <work>\n    <work-title>{escape(title)}</work-title>\n  </work>\n'
+        + f'  <identification>\n    <creator type="composer">{escape(composer)}</creator>\n  </identification>\n'
+        + '  <part-list>\n    <score-part id="P1">\n      <part-name>Music</part-name>\n'
+        + '    </score-part>\n  </part-list>\n'
+        + '  <part id="P1">\n'
+    )
 
-    """Добовляем тактовый размер"""
-    Takt_time_in_music21=['2/2','2/4','3/2','3/4','3/8','4/4','6/8','9/8','common']
-    Takt_time=['time_2_2','time_2_4','time_3_2','time_3_4','time_3_8','time_4_4','time_6_8','time_9_8','time_common']
-    time=0
-    for simbol in Sort_data_note:
-        if simbol[0] in Takt_time:
-            time=simbol[0]
-            Sort_data_note.remove(simbol)
-    s.append(meter.TimeSignature(Takt_time_in_music21[Takt_time.index(time)]))
 
+SCORE_FOOTER = '  </part>\n</score-partwise>\n'
 
 
-    """Добавляем ноты, знаки альтерации"""
-    for element_type, (x, y, width, height) in Sort_data_note:
+def measure_to_string(measure):
+    """Такт в виде текста с отступами для вставки внутрь <part>"""
+    ET.indent(measure, space='  ', level=2)
+    return '    ' + ET.tostring(measure, encoding='unicode') + '\n'
 
-        # Обработка нот
-        if element_type.startswith('note_'):
-            duration_type = element_type.split('_')[1]
-            note_name = element_type.split('_')[2] if len(element_type.split('_')) > 2 else 'C'
-            accidental = element_type.split('_')[3] if len(element_type.split('_')) > 3 else None
 
-            # Создаем ноту
-            n = note.Note(note_name.upper())
+# Сжатый MusicXML (.mxl): zip, первым файлом несжатый mimetype, затем META-INF/container.xml
+MXL_MIMETYPE = 'application/vnd.recordare.musicxml'
+MXL_CONTAINER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<container>\n'
+    '  <rootfiles>\n'
+    '    <rootfile full-path={} media-type="application/vnd.recordare.musicxml+xml"/>\n'
+    '  </rootfiles>\n'
+    '</container>\n'
+)
 
-            # Устанавливаем длительность
-            if duration_type == 'whole':
-                n.duration.type = 'whole'
-            elif duration_type == 'half':
-                n.duration.type = 'half'
-            elif duration_type == 'quarter':
-                n.duration.type = 'quarter'
-            elif duration_type == 'eighth':
-                n.duration.type = 'eighth'
 
-            # Устанавливаем знак альтерации
-            if accidental == 'sharp':
-                n.pitch.accidental = pitch.Accidental('sharp')
-            elif accidental == 'flat':
-                n.pitch.accidental = pitch.Accidental('flat')
-            elif accidental == 'natural':
-                n.pitch.accidental = pitch.Accidental('natural')
-            elif accidental == 'double_sharp':
-                n.pitch.accidental = pitch.Accidental('double_sharp')
+def is_mxl(path):
+    return str(path).lower().endswith('.mxl')
 
-            s.append(n)
 
-        # Обработка пауз
-        elif element_type.startswith('rest_'):
-            duration_type = element_type.split('_')[1]
+def _open_mxl(mxl_path, rootfile, compresslevel=DEFAULT_COMPRESS_LEVEL):
+    """Архив .mxl с mimetype и container.xml; партитура записывается в rootfile"""
+    archive = zipfile.ZipFile(mxl_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+    archive.writestr(zipfile.ZipInfo('mimetype'), MXL_MIMETYPE, compress_type=zipfile.ZIP_STORED)
+    archive.writestr('META-INF/container.xml', MXL_CONTAINER.format(quoteattr(rootfile)))
+    return archive
 
-            r = note.Rest()
 
-            if duration_type == 'whole':
-                r.duration.type = 'whole'
-            elif duration_type == 'half':
-                r.duration.type = 'half'
-            elif duration_type == 'quarter':
-                r.duration.type = 'quarter'
-            elif duration_type == 'eighth':
-                r.duration.type = 'eighth'
+def _rootfile_name(mxl_path):
+    return os.path.splitext(os.path.basename(mxl_path))[0] + '.musicxml'
 
-            s.append(r)
 
-    s.write('musicxml', fp="example.musicxml")
+def compress_musicxml(musicxml_path, mxl_path=None, compresslevel=DEFAULT_COMPRESS_LEVEL):
+    """
+    Упаковка готового .musicxml в .mxl
 
+    Возвращает:
+        Путь к .mxl (по умолчанию рядом, с тем же именем)
+    """
+    mxl_path = mxl_path or os.path.splitext(musicxml_path)[0] + '.mxl'
+    with _open_mxl(mxl_path, _rootfile_name(mxl_path), compresslevel) as archive:
+        archive.write(musicxml_path, _rootfile_name(mxl_path))
+    return mxl_path
 
 
+class StreamingMusicXMLWriter:
+    """
+    Потоковая запись MusicXML по мере распознавания станов
 
+    При создании пишется начало документа score-partwise, add_staff дописывает
+    заполненные такты стана и сбрасывает файл на диск, close закрывает документ.
+    В памяти хранится только незаполненный такт. Если процесс оборвался,
+    файл заканчивается на последнем целом такте и восстанавливается
+    repair_partial_musicxml.
 
+    Для output_file с расширением .mxl партитура сжимается в zip по мере записи;
+    оглавление zip пишется при close, поэтому оборванный .mxl не восстанавливается.
+    """
 
+    def __init__(self, output_file, title=DEFAULT_TITLE, composer=DEFAULT_COMPOSER,
+                 compresslevel=DEFAULT_COMPRESS_LEVEL):
+        self.output_file = output_file
+        self._builder = MeasureBuilder()
+        self._archive = None
+        if is_mxl(output_file):
+            rootfile = _rootfile_name(output_file)
+            self._archive = _open_mxl(output_file, rootfile, compresslevel)
+            self._file = io.TextIOWrapper(self._archive.open(rootfile, 'w', force_zip64=True), encoding='utf-8')
+        else:
+            self._file = open(output_file, 'w', encoding='utf-8')
+        self._file.write(score_header(title, composer))
+        self._file.flush()
 
+    def add_staff(self, symbols):
+        """
+        Аргументы:
+            symbols: символы одного стана — словари {'class', 'bbox'} или кортежи (класс, (x, y, w, h))
+        """
+        self._write_staff(sorted((_symbol_fields(symbol) for symbol in symbols), key=lambda s: s[2]))
+        self._file.flush()
 
+    def _write_staff(self, symbols):
+        """Символы одного стана уже в порядке слева направо"""
+        for measure in self._builder.start_system():
+            self._file.write(measure_to_string(measure))
+        for *_, symbol_class in symbols:
+            parsed = parse_symbol(symbol_class)
+            if parsed is not None:
+                for measure in self._builder.add(parsed):
+                    self._file.write(measure_to_string(measure))
+
+    def close(self):
+        if self._file.closed:
+            return
+        for measure in self._builder.finish():
+            self._file.write(measure_to_string(measure))
+        self._file.write(SCORE_FOOTER)
+        self._file.close()
+        if self._archive is not None:
+            self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def repair_partial_musicxml(path):
+    """
+    Закрытие документа, оборванного во время записи StreamingMusicXMLWriter
+
+    Хвост после последнего целого такта отбрасывается, дописывается конец документа.
+
+    Возвращает:
+        True, если файл был исправлен; False, если документ уже закрыт
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    if text.rstrip().endswith('</score-partwise>'):
+        return False
+
+    end = text.rfind('</measure>')
+    if end != -1:
+        text = text[:end + len('</measure>')] + '\n'
+    else:
+        part_start = text.find('<part id="P1">')
+        if part_start == -1:
+            raise ValueError(f"{path}: нет начала партии, документ не восстановить")
+        text = text[:part_start + len('<part id="P1">')] + '\n    <measure number="1" />\n'
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text + SCORE_FOOTER)
+    return True
+
+
+class MusicXMLExporter:
+    """
+    Экспорт результатов распознавания в MusicXML
+
+    Бэкенды:
+        'etree' — символы разбираются за один проход, такты пишутся в файл
+                  по мере заполнения через xml.etree, без импорта music21;
+        'music21' — построение music21.stream.Stream (медленнее, но music21
+                  проверяет и нормализует партитуру).
+    """
+
+    BACKENDS = ('etree', 'music21')
+
+    def __init__(self, backend='etree', title=DEFAULT_TITLE, composer=DEFAULT_COMPOSER,
+                 compresslevel=DEFAULT_COMPRESS_LEVEL):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Неизвестный бэкенд экспорта: {backend}")
+        self.backend = backend
+        self.title = title
+        self.composer = composer
+        self.compresslevel = compresslevel
+
+    def export_from_recognition_results(self, results, output_file):
+        """
+        Аргументы:
+            results: список словарей {'class', 'bbox', ['page', 'staff']}
+                     или кортежей (класс, (x, y, w, h))
+            output_file: путь к .musicxml или .mxl (сжатый MusicXML)
+
+        Возвращает:
+            output_file
+        """
+        symbols = sort_symbols(results)
+        if self.backend == 'music21':
+            _music21_export([symbol_class for *_, symbol_class in symbols], output_file,
+                            self.title, self.composer)
+        else:
+            with StreamingMusicXMLWriter(output_file, self.title, self.composer, self.compresslevel) as writer:
+                for _, staff_symbols in groupby(symbols, key=lambda s: s[:2]):
+                    writer._write_staff(staff_symbols)
+        return output_file
+
+    def export_batch(self, scores, workers=1):
+        """
+        Экспорт нескольких партитур с общими настройками (бэкенд, автор, сжатие)
+
+        Аргументы:
+            scores: словарь {output_file: results} или список кортежей
+                    (output_file, results) / (output_file, results, title)
+            workers: число процессов; 1 — последовательно
+
+        Возвращает:
+            Список путей в порядке scores
+        """
+        items = list(scores.items()) if isinstance(scores, dict) else list(scores)
+        if workers > 1 and len(items) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(self._export_item, items))
+        return [self._export_item(item) for item in items]
+
+    def _export_item(self, item):
+        output_file, results, *title = item
+        exporter = self
+        if title:
+            exporter = copy.copy(self)
+            exporter.title = title[0]
+        return exporter.export_from_recognition_results(results, output_file)
+
+
+def _music21_export(symbol_classes, output_file, title=DEFAULT_TITLE, composer=DEFAULT_COMPOSER):
+    """Бэкенд music21: символы уже в порядке чтения"""
+    from music21 import stream, metadata, clef, meter, note, pitch
+
+    s = stream.Stream()
+
+    """Добавление методанных"""
+    s.insert(0, metadata.Metadata())
+    s.metadata.title = title
+    s.metadata.composer = composer
+
+    """Разбор символов за один проход: первый ключ и размер идут в начало"""
+    dict_key = {"G": clef.TrebleClef, "F": clef.BassClef, "C": clef.AltoClef}
+    clef_symbol = None
+    time_symbol = None
+    elements = []
+    for symbol_class in symbol_classes:
+        parsed = parse_symbol(symbol_class)
+        if parsed is None:
+            continue
+        if parsed[0] == 'clef':
+            clef_symbol = clef_symbol or parsed
+        elif parsed[0] == 'time':
+            time_symbol = time_symbol or parsed
+        else:
+            elements.append(parsed)
+
+    if clef_symbol is not None:
+        s.append(clef.Treble8vbClef() if clef_symbol[3] == -1 else dict_key[clef_symbol[1]]())
+    if time_symbol is not None:
+        s.append(meter.TimeSignature(f"{time_symbol[1]}/{time_symbol[2]}"))
+
+    """Добавляем ноты, знаки альтерации и паузы"""
+    for parsed in elements:
+        if parsed[0] == 'note':
+            n = note.Note(parsed[2])
+            if parsed[3] is not None:
+                n.pitch.accidental = pitch.Accidental(ACCIDENTAL_NAMES[parsed[3]])
+        else:
+            n = note.Rest()
+        n.duration.type = DURATIONS[parsed[1]][1]
+        s.append(n)
+
+    s.write('mxl' if is_mxl(output_file) else 'musicxml', fp=output_file)
+
+
+def MusicXML_Exporter(Data_note, output_file="example.musicxml"):
+    """Экспорт через music21 списка (класс, (x, y, w, h)) одного стана"""
+
+    """Сортировка нот по X координате"""
+    Sort_data_note = sorted(Data_note, key=lambda x: x[1][0], reverse=False)
+    _music21_export([simbol[0] for simbol in Sort_data_note], output_file)
 
 
-"""ПРИМЕР РАБОТЫ"""
+if __name__ == "__main__":
+    """ПРИМЕР РАБОТЫ"""
 
-example_notes = [
+    example_notes = [
         ('time_4_4', (1, 2, 3, 6)),
         ('clef_g', (10, 20, 30, 60)),
         ('rest_half', (102, 38, 20, 20)),
@@ -122,4 +540,5 @@ example_notes = [
         ('note_quarter_A', (166, 38, 20, 20)),
     ]
 
-MusicXML_Exporter(example_notes)
\ No newline at end of file
+    MusicXMLExporter().export_from_recognition_results(example_notes, "example.musicxml")
+    print(f"Сохранено: {os.path.abspath('example.musicxml')}")
@@ -0,0 +1,35 @@
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xml_exporter.export import MusicXMLExporter
+
+
+def _measures(path):
+    return list(ET.parse(path).getroot().find('part'))
+
+
+def _filled(measure):
+    return sum(int(duration.text) for duration in measure.iter('duration'))
+
+
+def test_each_staff_starts_new_measure(tmp_path):
+    symbols = ([{'class': 'note_head_quarter', 'bbox': [x, 0, 1, 1], 'page': 0, 'staff': 0} for x in range(3)]
+               + [{'class': 'note_head_half', 'bbox': [x, 0, 1, 1], 'page': 0, 'staff': 1} for x in range(3)])
+    output = str(tmp_path / 'score.musicxml')
+    MusicXMLExporter().export_from_recognition_results(symbols, output)
+
+    measures = _measures(output)
+    assert [_filled(m) for m in measures] == [12, 16, 8]
+    assert [m.find('print') is not None for m in measures] == [False, True, False]
+
+
+def test_note_overflowing_measure_starts_next(tmp_path):
+    symbols = [('note_quarter_C', (0, 0, 1, 1)), ('note_quarter_D', (1, 0, 1, 1)),
+               ('note_quarter_E', (2, 0, 1, 1)), ('note_half_F', (3, 0, 1, 1))]
+    output = str(tmp_path / 'score.musicxml')
+    MusicXMLExporter().export_from_recognition_results(symbols, output)
+
+    assert [_filled(m) for m in _measures(output)] == [12, 8]